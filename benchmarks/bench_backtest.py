@@ -0,0 +1,88 @@
+"""Time the walk-forward backtest with and without warm starts.
+
+Also compares the batched evaluation of all windows with the per-strategy
+pandas loop used for the single backtest window before. Importing preprocess
+connects to the database configured for `database.engine`, e.g.
+
+POSTGRES_HOST=localhost python benchmarks/bench_backtest.py --pools 100 300 --days 480
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(1, os.path.join(sys.path[0], ".."))
+sys.path.insert(1, os.path.join(sys.path[0], "..", "reports", "frontier"))
+
+from backtest import (
+    STRATEGIES,
+    TEST_DAYS,
+    TRAIN_DAYS,
+    evaluate,
+    walk_forward,
+    window_weights,
+)
+from bench_optimizers import make_returns
+
+
+def legacy_evaluate(returns, weights, starts, test=TEST_DAYS):
+    # cumprod over pandas series, one strategy and window at a time
+    metrics = []
+    for idx in range(len(STRATEGIES)):
+        for window, start in enumerate(starts):
+            window_returns = returns.iloc[start : start + test]
+            growth = (1 + (window_returns * weights[idx, window]).sum(axis=1)).cumprod()
+            metrics.append((growth.iloc[-1] - 1, (growth / growth.cummax() - 1).min()))
+    return metrics
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    out = func(*args, **kwargs)
+    return time.perf_counter() - start, out
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pools", type=int, nargs="+", default=[100, 300])
+    parser.add_argument("--days", type=int, default=480)
+    parser.add_argument("--step", type=int, default=7)
+    args = parser.parse_args()
+
+    for num_pools in args.pools:
+        returns = make_returns(num_pools, args.days)
+        returns.index = pd.date_range("2022-01-01", periods=args.days)
+        pools = pd.Series(
+            [
+                {"id": name, "name": name, "protocol": "Bench", "start": 0}
+                for name in returns
+            ],
+            index=returns.columns,
+        )
+        starts = np.arange(args.days - TEST_DAYS, TRAIN_DAYS - 1, -args.step)[::-1]
+        print(f"{num_pools} pools, {len(starts)} windows")
+
+        for warm_start in [False, True]:
+            elapsed, results = timed(
+                walk_forward, pools, returns, step=args.step, warm_start=warm_start
+            )
+            label = "warm start" if warm_start else "cold start"
+            turnover = results.xs("turnover", axis=1, level=1).mean()
+            print(
+                f"  {label}  {elapsed:8.2f}s"
+                f"  tangency turnover {turnover['tangency']:.4f}"
+            )
+
+        weights = window_weights(pools, returns, starts)
+        elapsed, _ = timed(evaluate, returns, weights, starts)
+        print(f"  batched evaluation {elapsed * 1e3:8.2f}ms")
+        elapsed, _ = timed(legacy_evaluate, returns, weights, starts)
+        print(f"  pandas evaluation  {elapsed * 1e3:8.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
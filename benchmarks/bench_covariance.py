@@ -0,0 +1,95 @@
+"""Compare the covariance estimators by conditioning and optimizer convergence.
+
+For each estimator, reports the condition number of the covariance, the time
+to estimate and factor it, and the SLSQP iterations and time of the min
+volatility and tangency portfolios. Importing preprocess connects to the
+database configured for `database.engine`, e.g.
+
+POSTGRES_HOST=localhost python benchmarks/bench_covariance.py --pools 100 500
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from scipy.optimize import minimize
+
+sys.path.insert(1, os.path.join(sys.path[0], ".."))
+sys.path.insert(1, os.path.join(sys.path[0], "..", "reports", "frontier"))
+
+from bench_optimizers import make_returns
+from covariance import ESTIMATORS, cholesky_factor, estimate_covariance
+from preprocess import BUDGET_CONSTRAINT, _volatility
+
+
+def solve(objective, num_pools):
+    # the optimizer setup of the min volatility and tangency portfolios
+    start = time.perf_counter()
+    result = minimize(
+        objective,
+        num_pools * [1 / num_pools],
+        jac=True,
+        bounds=tuple((0, 1) for _ in range(num_pools)),
+        constraints=(BUDGET_CONSTRAINT,),
+    )
+    return time.perf_counter() - start, result
+
+
+def min_volatility(mu, factor):
+    return lambda weights: _volatility(weights, factor)
+
+
+def neg_sharpe_ratio(mu, factor):
+    def objective(weights):
+        portfolio_std, std_grad = _volatility(weights, factor)
+        sharpe_ratio = (mu @ weights - 0.03) / portfolio_std
+        return -sharpe_ratio, -(mu - sharpe_ratio * std_grad) / portfolio_std
+
+    return objective
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pools", type=int, nargs="+", default=[100, 500])
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument(
+        "--estimators", nargs="+", default=list(ESTIMATORS), choices=ESTIMATORS
+    )
+    args = parser.parse_args()
+
+    for num_pools in args.pools:
+        returns = make_returns(num_pools, args.days)
+        T = 30
+        mu = ((1 + returns).prod() ** (T / len(returns)) - 1).to_numpy()
+        print(f"{num_pools} pools, {args.days} days")
+        for estimator in args.estimators:
+            start = time.perf_counter()
+            cov = estimate_covariance(returns, estimator) * T
+            estimated = time.perf_counter() - start
+            start = time.perf_counter()
+            factor = cholesky_factor(cov)
+            factored = time.perf_counter() - start
+            start = time.perf_counter()
+            cholesky_factor(cov)
+            cached = time.perf_counter() - start
+            condition = np.linalg.cond(cov.to_numpy())
+            print(
+                f"  {estimator:>12}: cond {condition:9.2e}  estimate {estimated:.3f}s"
+                f"  cholesky {factored:.3f}s, cached {cached * 1e3:.1f}ms"
+            )
+            for name, objective in [
+                ("min volatility", min_volatility),
+                ("tangency", neg_sharpe_ratio),
+            ]:
+                elapsed, result = solve(objective(mu, factor), num_pools)
+                status = "converged" if result.success else result.message
+                print(
+                    f"    {name:>14}: {result.nit:4d} iterations {elapsed:8.2f}s"
+                    f"  {status}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""EXPLAIN ANALYZE the hot snapshot queries with and without the indexes.
+
+Seeds the database configured for `database.engine` with generated rows,
+prefixed with `bench_` and removed afterwards. Use a local database, e.g.
+
+POSTGRES_HOST=localhost python benchmarks/bench_indexes.py --pools 2000 --days 1000
+"""
+
+import argparse
+import os
+import re
+import sys
+
+from sqlalchemy import text
+from sqlmodel import SQLModel
+
+sys.path.insert(1, os.path.join(sys.path[0], ".."))
+
+from database.engine import engine
+from database.models import PoolSnapshot, TokenSnapshot
+
+QUERIES = {
+    "top pools by tvl": """
+        SELECT * FROM poolsnapshot
+        WHERE "blockNumber" = :block
+        ORDER BY "totalValueLocked" DESC
+        LIMIT 50
+    """,
+    "token prices": """
+        SELECT * FROM tokensnapshot
+        WHERE token_id = 'bench_token_7'
+        ORDER BY timestamp
+    """,
+    "pool history": """
+        SELECT timestamp, "totalValueLocked", "cumulativeReward" FROM poolsnapshot
+        WHERE pool_id = 'bench_pool_7'
+        ORDER BY timestamp
+    """,
+}
+
+
+def seed(connection, num_pools, num_days):
+    connection.execute(
+        text("""
+            INSERT INTO pool (id, name, protocol)
+            SELECT 'bench_pool_' || p, 'Bench ' || p, 'Bench'
+            FROM generate_series(0, :pools - 1) p;
+
+            INSERT INTO token (id, name, symbol)
+            SELECT 'bench_token_' || t, 'Bench ' || t, 'BENCH'
+            FROM generate_series(0, 2 * :pools - 1) t;
+
+            INSERT INTO pooltokenlink (pool_id, token_id)
+            SELECT 'bench_pool_' || p, 'bench_token_' || (2 * p + k)
+            FROM generate_series(0, :pools - 1) p, generate_series(0, 1) k;
+
+            INSERT INTO poolsnapshot (
+                id, "blockNumber", timestamp, "totalValueLocked",
+                "cumulativeReward", pool_id
+            )
+            SELECT
+                'bench_pool_' || p || '_' || (10000000 + 7200 * d),
+                10000000 + 7200 * d,
+                1600000000 + 86400 * d,
+                random() * 1e8,
+                d * random(),
+                'bench_pool_' || p
+            FROM generate_series(0, :pools - 1) p, generate_series(0, :days - 1) d;
+
+            INSERT INTO tokensnapshot (id, "blockNumber", timestamp, price, token_id)
+            SELECT
+                'bench_token_' || t || '_' || (10000000 + 7200 * d),
+                10000000 + 7200 * d,
+                1600000000 + 86400 * d,
+                random() * 1e3,
+                'bench_token_' || t
+            FROM generate_series(0, 2 * :pools - 1) t, generate_series(0, :days / 2 - 1) d;
+            """),
+        {"pools": num_pools, "days": num_days},
+    )
+    connection.execute(text("ANALYZE"))
+
+
+def cleanup(connection):
+    for table in ["tokensnapshot", "poolsnapshot", "pooltokenlink"]:
+        column = "token_id" if table == "tokensnapshot" else "pool_id"
+        connection.execute(text(f"DELETE FROM {table} WHERE {column} LIKE 'bench_%'"))
+    connection.execute(text("DELETE FROM token WHERE id LIKE 'bench_%'"))
+    connection.execute(text("DELETE FROM pool WHERE id LIKE 'bench_%'"))
+
+
+def explain(connection, query, params):
+    rows = connection.execute(text("EXPLAIN ANALYZE " + query), params).all()
+    plan = [row[0] for row in rows]
+    elapsed = float(re.search(r"Execution Time: ([\d.]+) ms", plan[-1]).group(1))
+    return elapsed, plan[0].strip()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pools", type=int, default=2000)
+    parser.add_argument("--days", type=int, default=1000)
+    args = parser.parse_args()
+
+    indexes = [
+        index
+        for table in [PoolSnapshot.__table__, TokenSnapshot.__table__]
+        for index in table.indexes
+    ]
+    params = {"block": 10000000 + 7200 * (args.days - 1)}
+    with engine.begin() as connection:
+        cleanup(connection)
+        seed(connection, args.pools, args.days)
+    try:
+        results = {}
+        for label in ["without indexes", "with indexes"]:
+            with engine.begin() as connection:
+                for index in indexes:
+                    if label == "without indexes":
+                        index.drop(connection, checkfirst=True)
+                    else:
+                        index.create(connection, checkfirst=True)
+                connection.execute(text("ANALYZE"))
+                for name, query in QUERIES.items():
+                    results[name, label] = explain(connection, query, params)
+
+        rows = args.pools * args.days
+        print(f"{rows} pool snapshots, {rows} token snapshots")
+        for name in QUERIES:
+            print(name)
+            for label in ["without indexes", "with indexes"]:
+                elapsed, plan = results[name, label]
+                print(f"  {label:>16}: {elapsed:10.3f} ms  {plan}")
+    finally:
+        with engine.begin() as connection:
+            cleanup(connection)
+            SQLModel.metadata.create_all(connection)
+
+
+if __name__ == "__main__":
+    main()
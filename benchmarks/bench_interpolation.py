@@ -0,0 +1,92 @@
+"""Compare snapshot interpolation against the previous per-block DataFrame.
+
+python benchmarks/bench_interpolation.py --pools 1 100 10000
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(1, os.path.join(sys.path[0], ".."))
+
+from stub_subgraph import BLOCKS_PER_DAY, make_pools, make_snapshots
+
+from messari.subgraphs import interpolate_snapshots
+
+
+def legacy_interpolate(data, blocks):
+    # the implementation replaced by interpolate_snapshots
+    out = pd.DataFrame(
+        None,
+        index=range(blocks[0], blocks[-1] + 1),
+        columns=["timestamp", "totalValueLocked", "cumulativeReward"],
+    )
+    for snapshot in data:
+        out.loc[int(snapshot["blockNumber"])] = [
+            int(snapshot["timestamp"]),
+            float(snapshot["totalValueLockedUSD"]),
+            float(snapshot["cumulativeSupplySideRevenueUSD"]),
+        ]
+    out = out.apply(pd.to_numeric).interpolate(limit_direction="both")
+    return [snapshot for _, snapshot in out.loc[blocks].iterrows()]
+
+
+def measure(fn, data, blocks):
+    tracemalloc.start()
+    start = time.perf_counter()
+    for snapshots in data:
+        fn(snapshots, blocks)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 2**20
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pools", type=int, nargs="+", default=[1, 100, 10000])
+    parser.add_argument("--days", type=int, default=120)
+    parser.add_argument(
+        "--legacy-max",
+        type=int,
+        default=100,
+        help="extrapolate the legacy timing linearly above this many pools",
+    )
+    args = parser.parse_args()
+
+    start_block = 15_000_000
+    blocks = [start_block + day * BLOCKS_PER_DAY for day in range(args.days)]
+    print(f"{'pools':>6} {'impl':>8} {'time (s)':>10} {'peak (MiB)':>11}")
+    for num_pools in args.pools:
+        # keep the snapshots within the block range, as the subgraph query does
+        data = [
+            [
+                snapshot
+                for snapshot in make_snapshots(pool, args.days, start_block)
+                if int(snapshot["blockNumber"]) <= blocks[-1]
+            ]
+            for pool in make_pools(num_pools)
+        ]
+        elapsed, peak = measure(interpolate_snapshots, data, blocks)
+        print(f"{num_pools:>6} {'numpy':>8} {elapsed:>10.3f} {peak:>11.2f}")
+
+        n = min(num_pools, args.legacy_max)
+        elapsed, peak = measure(legacy_interpolate, data[:n], blocks)
+        suffix = "" if n == num_pools else f"  (extrapolated from {n} pools)"
+        elapsed *= num_pools / n
+        print(f"{num_pools:>6} {'legacy':>8} {elapsed:>10.3f} {peak:>11.2f}{suffix}")
+
+        # both implementations agree on the interpolated values
+        new = interpolate_snapshots(data[0], blocks)
+        old = np.array(legacy_interpolate(data[0], blocks), dtype=float)
+        assert np.allclose(old[:, 1], new["totalValueLocked"])
+        assert np.allclose(old[:, 2], new["cumulativeReward"])
+
+
+if __name__ == "__main__":
+    main()
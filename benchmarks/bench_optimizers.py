@@ -0,0 +1,191 @@
+"""Time the portfolio optimizers against their previous implementations.
+
+Optimizers are compared with finite-difference gradients, and the efficient
+frontier traced by the critical line algorithm with one SLSQP solve per point.
+
+Importing preprocess connects to the database configured for
+`database.engine`, e.g.
+
+POSTGRES_HOST=localhost python benchmarks/bench_optimizers.py --pools 100 500 2000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from scipy.optimize import minimize
+
+sys.path.insert(1, os.path.join(sys.path[0], ".."))
+sys.path.insert(1, os.path.join(sys.path[0], "..", "reports", "frontier"))
+
+from covariance import COVARIANCE_ESTIMATOR, cholesky_factor, estimate_covariance
+from preprocess import (
+    BUDGET_CONSTRAINT,
+    _volatility,
+    corner_portfolios,
+    efficient_frontier,
+    min_volatility_portfolio,
+    tangency_portfolio,
+)
+
+
+def make_returns(num_pools, num_days=90, seed=0):
+    # daily returns driven by a few common factors
+    rng = np.random.default_rng(seed)
+    factors = rng.normal(0.0, 0.02, (num_days, 5))
+    loadings = rng.normal(0.0, 1.0, (5, num_pools))
+    returns = factors @ loadings + rng.normal(0.001, 0.01, (num_days, num_pools))
+    return pd.DataFrame(returns, columns=[f"pool {idx}" for idx in range(num_pools)])
+
+
+def make_inputs(num_pools, num_days=90, seed=0, estimator=COVARIANCE_ESTIMATOR):
+    # monthly stats, as in pool_stats
+    returns = make_returns(num_pools, num_days, seed)
+    T = 30
+    mu = (1 + returns).prod() ** (T / len(returns)) - 1
+    cov = estimate_covariance(returns, estimator) * T
+    return mu, cov
+
+
+def legacy_min_volatility(mu, cov):
+    # finite-difference gradients, as before
+    def volatility(weights):
+        return np.sqrt((weights[np.newaxis, :] @ cov @ weights[:, np.newaxis]).sum())
+
+    N = len(mu)
+    constraints = ({"type": "eq", "fun": lambda x: np.sum(x) - 1},)
+    bounds = tuple((0, 1) for _ in range(N))
+    result = minimize(volatility, N * [1 / N], bounds=bounds, constraints=constraints)
+    return result.fun, result.x
+
+
+def legacy_tangency(mu, cov):
+    def neg_sharpe_ratio(weights):
+        portfolio_return = (mu * weights).sum()
+        portfolio_std = np.sqrt(
+            (weights[np.newaxis, :] @ cov @ weights[:, np.newaxis]).sum()
+        )
+        return -(portfolio_return - 0.03) / portfolio_std
+
+    N = len(mu)
+    constraints = ({"type": "eq", "fun": lambda x: np.sum(x) - 1},)
+    bounds = tuple((0, 1) for _ in range(N))
+    result = minimize(
+        neg_sharpe_ratio, N * [1 / N], bounds=bounds, constraints=constraints
+    )
+    return -result.fun, result.x
+
+
+def legacy_frontier(mu, cov, num_samples):
+    # maximize the return for every target std, as before
+    mu_, factor = np.asarray(mu, dtype=float), cholesky_factor(cov)
+
+    def efficient_return(target_std):
+        N = len(mu)
+        constraints = (
+            {
+                "type": "eq",
+                "fun": lambda x: _volatility(x, factor)[0] - target_std,
+                "jac": lambda x: _volatility(x, factor)[1],
+            },
+            BUDGET_CONSTRAINT,
+        )
+        result = minimize(
+            lambda x: (-(mu_ @ x), -mu_),
+            N * [1 / N],
+            jac=True,
+            bounds=tuple((0, 1) for _ in range(N)),
+            constraints=constraints,
+        )
+        return -result.fun
+
+    sigma_min = min_volatility_portfolio(mu, cov)[1][0]
+    xs = np.linspace(sigma_min, np.sqrt(np.diag(cov)).max(), num_samples)
+    ys, last_y = [], 0.0
+    for x in xs:
+        new_y = efficient_return(x)
+        if new_y < last_y:
+            break
+        last_y = new_y
+        ys.append(new_y)
+    return xs[: len(ys)], ys
+
+
+def sharpe(mu, cov, weights):
+    weights = np.asarray(weights)
+    std = np.sqrt(weights @ np.asarray(cov) @ weights)
+    return (np.asarray(mu) @ weights - 0.03) / std
+
+
+def check_tied_returns():
+    # pools with equal returns still reach the minimum variance portfolio
+    mu = pd.Series([0.05, 0.05, 0.01])
+    cov = pd.DataFrame(np.diag([0.01, 0.01, 0.02]))
+    corners = corner_portfolios(mu, cov)
+    _, std, _ = min_volatility_portfolio(mu, cov)
+    assert np.allclose(corners[-1], [0.4, 0.4, 0.2]), corners[-1]
+    assert np.isclose(np.sqrt(corners[-1] @ cov @ corners[-1]), std[0], rtol=1e-4)
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    out = func(*args)
+    return time.perf_counter() - start, out
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pools", type=int, nargs="+", default=[100, 500, 2000])
+    parser.add_argument("--samples", type=int, default=10)
+    parser.add_argument(
+        "--legacy-max",
+        type=int,
+        default=500,
+        help="largest number of pools solved with finite differences",
+    )
+    parser.add_argument(
+        "--frontier-max",
+        type=int,
+        default=200,
+        help="largest number of pools traced with one SLSQP solve per point",
+    )
+    args = parser.parse_args()
+
+    check_tied_returns()
+    for num_pools in args.pools:
+        mu, cov = make_inputs(num_pools)
+        legacy = num_pools <= args.legacy_max
+        print(f"{num_pools} pools")
+
+        elapsed, (_, std, _) = timed(min_volatility_portfolio, mu, cov)
+        print(f"  min volatility {elapsed:8.2f}s  std {float(std[0]):.5f}")
+        if legacy:
+            elapsed, (std, _) = timed(legacy_min_volatility, mu, cov)
+            print(f"    finite diffs {elapsed:8.2f}s  std {std:.5f}")
+
+        elapsed, (_, _, weights) = timed(tangency_portfolio, mu, cov)
+        ratio = sharpe(mu, cov, weights)
+        print(f"  tangency       {elapsed:8.2f}s  sharpe {ratio:.4f}")
+        if legacy:
+            elapsed, (_, weights) = timed(legacy_tangency, mu, cov)
+            ratio = sharpe(mu, cov, weights)
+            print(f"    finite diffs {elapsed:8.2f}s  sharpe {ratio:.4f}")
+
+        elapsed, (xs, ys, _) = timed(efficient_frontier, mu, cov, args.samples)
+        print(
+            f"  frontier       {elapsed:8.2f}s  {len(xs)} of {args.samples} points"
+            f"  max return {max(ys, default=np.nan):.5f}"
+        )
+        if num_pools <= args.frontier_max:
+            elapsed, (xs, ys) = timed(legacy_frontier, mu, cov, args.samples)
+            print(
+                f"    slsqp        {elapsed:8.2f}s  {len(xs)} of {args.samples} points"
+                f"  max return {max(ys, default=np.nan):.5f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""Compare sequential and concurrent pagination against a stub subgraph.
+
+python benchmarks/bench_pagination.py --subgraphs 29 --pools 5000
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(1, os.path.join(sys.path[0], ".."))
+
+from stub_subgraph import StubSubgraph
+
+import messari.subgraphs
+from messari.fetch import fetch_pools
+from messari.subgraphs import Subgraph
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--subgraphs", type=int, default=29)
+    parser.add_argument("--pools", type=int, default=5000)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    with StubSubgraph(num_pools=args.pools, num_days=1, latency=args.latency) as url:
+        messari.subgraphs.BASE_URL = url
+        subgraphs = [
+            Subgraph(f"Stub {idx}", "DEX AMM", f"stub-{idx}")
+            for idx in range(args.subgraphs)
+        ]
+
+        start = time.perf_counter()
+        sequential = {subgraph.protocol: subgraph.pools for subgraph in subgraphs}
+        elapsed = time.perf_counter() - start
+        print(f"sequential: {elapsed:.2f}s")
+
+        start = time.perf_counter()
+        concurrent = asyncio.run(fetch_pools(subgraphs))
+        elapsed = time.perf_counter() - start
+        print(f"concurrent: {elapsed:.2f}s")
+
+    assert sequential == concurrent
+
+
+if __name__ == "__main__":
+    main()
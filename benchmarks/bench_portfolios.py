@@ -0,0 +1,54 @@
+"""Time the report portfolios solved over process pools of different sizes.
+
+Importing preprocess connects to the database configured for
+`database.engine`, e.g.
+
+POSTGRES_HOST=localhost python benchmarks/bench_portfolios.py --pools 500 --processes 1 2 4
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(1, os.path.join(sys.path[0], ".."))
+sys.path.insert(1, os.path.join(sys.path[0], "..", "reports", "frontier"))
+
+from bench_optimizers import make_inputs
+from preprocess import (
+    efficient_frontier,
+    min_volatility_portfolio,
+    risk_parity_portfolio,
+    solve_portfolios,
+    tangency_portfolio,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pools", type=int, default=500)
+    parser.add_argument(
+        "--processes", type=int, nargs="+", default=[1, 2, 4, os.cpu_count()]
+    )
+    args = parser.parse_args()
+
+    # the current and backtest windows, as in the report
+    problems = {}
+    for window, seed in [("current", 0), ("backtest", 1)]:
+        mu, cov = make_inputs(args.pools, seed=seed)
+        if window == "current":
+            problems[window, "frontier"] = (efficient_frontier, mu, cov)
+        problems[window, "tangency"] = (tangency_portfolio, mu, cov)
+        problems[window, "min_volatility"] = (min_volatility_portfolio, mu, cov)
+        problems[window, "risk_parity"] = (risk_parity_portfolio, mu, cov)
+
+    print(f"{args.pools} pools, {len(problems)} problems")
+    for processes in sorted(set(args.processes)):
+        start = time.perf_counter()
+        solve_portfolios(problems, processes)
+        elapsed = time.perf_counter() - start
+        print(f"  {processes:3d} processes {elapsed:8.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Compare sequential and parallel price fetching against a fake provider.
+
+python benchmarks/bench_prices.py --blocks 120 --tokens 200 --latency 0.2
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(1, os.path.join(sys.path[0], "..", "services", "exporters"))
+
+from pricing import PriceFetcher
+
+
+class FakeMagic:
+    """Stands in for `magic.get_prices`, sleeping for a fixed latency per
+    call plus a small cost per address, and failing some calls at random."""
+
+    def __init__(self, latency, per_address=0.001, failure_rate=0.0):
+        self.latency = latency
+        self.per_address = per_address
+        self.failure_rate = failure_rate
+
+    def __call__(self, addresses, block):
+        time.sleep(self.latency + self.per_address * len(addresses))
+        if random.random() < self.failure_rate:
+            raise ConnectionError("provider unavailable")
+        return [float(block % 97 + idx) for idx, _ in enumerate(addresses)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--blocks", type=int, default=120)
+    parser.add_argument("--tokens", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--failure-rate", type=float, default=0.05)
+    args = parser.parse_args()
+
+    get_prices = FakeMagic(args.latency, failure_rate=args.failure_rate)
+    addresses = [f"0x{idx:040x}" for idx in range(args.tokens)]
+    tasks = [(15_000_000 + 7200 * idx, addresses) for idx in range(args.blocks)]
+
+    start = time.perf_counter()
+    for block, addresses in tasks:
+        try:
+            get_prices(addresses, block)
+        except ConnectionError:
+            pass
+    elapsed = time.perf_counter() - start
+    print(f"sequential: {elapsed:.2f}s")
+
+    fetcher = PriceFetcher(
+        get_prices, max_concurrency=args.concurrency, backoff=args.latency
+    )
+    start = time.perf_counter()
+    results = list(fetcher.fetch(tasks))
+    elapsed = time.perf_counter() - start
+    failed = sum(prices is None for _, _, prices in results)
+    print(f"parallel:   {elapsed:.2f}s ({len(results)} chunks, {failed} failed)")
+
+
+if __name__ == "__main__":
+    main()
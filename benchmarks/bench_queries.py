@@ -0,0 +1,90 @@
+"""Compare building snapshot queries per page with parsing them once.
+
+Times the queries of `--pages` pages of batched snapshot queries, each for
+`--batch` pools, as built by the previous f-string queries and by the
+documents parsed once per schema type.
+
+python benchmarks/bench_queries.py --pages 10000 --batch 50
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from gql import gql
+
+sys.path.insert(1, os.path.join(sys.path[0], ".."))
+
+from messari.queries import PAGE_SIZE, QueryAPYManyParams, query_apy_many
+
+
+def legacy_query_apy_many(params, skip_id=""):
+    # the query text with the pools, blocks and cursor, parsed for every page
+    return gql(
+        f"""
+        {{
+            {params.snapshots} (
+                first: {PAGE_SIZE},
+                where: {{
+                    id_gt: "{skip_id}"
+                    {params.pool}_in: {json.dumps(params.pool_ids)}
+                    blockNumber_gte: {params.from_block}
+                    blockNumber_lte: {params.to_block}
+                }}
+            ) {{
+                id
+                {params.pool} {{
+                    id
+                }}
+                blockNumber
+                timestamp
+                totalValueLockedUSD
+                cumulativeSupplySideRevenueUSD
+                {params.token_weights}
+                {params.pool} {{
+                    {params.tokens} {{
+                        id
+                    }}
+                }}
+            }}
+        }}
+        """
+    )
+
+
+def measure(query, pages, batch):
+    start = time.perf_counter()
+    for page in range(pages):
+        pool_ids = [f"0x{page * batch + idx:040x}" for idx in range(batch)]
+        params = QueryAPYManyParams(
+            "liquidityPoolDailySnapshots",
+            "pool",
+            pool_ids,
+            15_000_000,
+            15_864_000,
+            "inputTokens",
+            "inputTokenWeights",
+        )
+        query(params, f"{pool_ids[0]}-{page:05d}")
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=10000)
+    parser.add_argument("--batch", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{args.pages} pages of {args.batch} pools")
+    for name, query in [
+        ("per page", legacy_query_apy_many),
+        ("parsed", query_apy_many),
+    ]:
+        elapsed = measure(query, args.pages, args.batch)
+        print(f"  {name:>8}: {elapsed:6.2f}s, {elapsed / args.pages * 1e6:7.1f}us/page")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""Compare slotted and columnar subgraph records with the previous dataclasses.
+
+Sweeps the pools of a universe and the snapshots of its top pools, timing
+the parsing into records and the conversion into database rows, and tracing
+the memory they hold.
+
+python benchmarks/bench_records.py --pools 500000 --snapshot-pools 10000 --days 120
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import Optional
+
+sys.path.insert(1, os.path.join(sys.path[0], ".."))
+
+from stub_subgraph import BLOCKS_PER_DAY, make_pools, make_snapshots
+
+from messari.subgraphs import Subgraph, interpolate_snapshots, nearest_snapshots
+
+
+@dataclass
+class LegacyToken:
+    id: str
+    name: str
+    symbol: str
+
+
+@dataclass
+class LegacyPool:
+    id: str
+    name: str
+    tokens: list[LegacyToken]
+
+
+@dataclass
+class LegacyPoolSnapshot:
+    id: str
+    blockNumber: int
+    timestamp: int
+    totalValueLocked: float
+    cumulativeReward: float
+    tokenWeights: Optional[dict[str, float]] = None
+
+
+def legacy_parse_pools(result):
+    return [
+        LegacyPool(
+            pool["id"],
+            pool["name"],
+            [LegacyToken(**token) for token in pool["inputTokens"]],
+        )
+        for pool in result
+    ]
+
+
+def legacy_split(pool_ids, data, params, blocks):
+    # snapshot objects of every pool, as the subgraphs used to return
+    grouped = {pool_id: [] for pool_id in pool_ids}
+    for snapshot in data:
+        grouped[snapshot[params.pool]["id"]].append(snapshot)
+    out = {}
+    for pool_id, data in grouped.items():
+        columns = interpolate_snapshots(data, blocks)
+        weights = [
+            Subgraph._parse_token_weights(data[idx], params)
+            for idx in nearest_snapshots(data, blocks)
+        ]
+        out[pool_id] = [
+            LegacyPoolSnapshot(pool_id + "_" + str(block), block, *values)
+            for block, *values in zip(
+                columns["blockNumber"].tolist(),
+                columns["timestamp"].tolist(),
+                columns["totalValueLocked"].tolist(),
+                columns["cumulativeReward"].tolist(),
+                weights,
+            )
+        ]
+    return out
+
+
+def legacy_rows(snapshots_by_pool):
+    # the per-snapshot loop the exporter used to build its rows with
+    rows = {
+        "id": [],
+        "blockNumber": [],
+        "timestamp": [],
+        "totalValueLocked": [],
+        "cumulativeReward": [],
+        "pool_id": [],
+    }
+    weights = {
+        "pool_id": [],
+        "token_id": [],
+        "blockNumber": [],
+        "timestamp": [],
+        "weight": [],
+    }
+    for pool_id, snapshots in snapshots_by_pool.items():
+        for snapshot in snapshots:
+            rows["id"].append(snapshot.id)
+            rows["blockNumber"].append(snapshot.blockNumber)
+            rows["timestamp"].append(snapshot.timestamp)
+            rows["totalValueLocked"].append(snapshot.totalValueLocked)
+            rows["cumulativeReward"].append(snapshot.cumulativeReward)
+            rows["pool_id"].append(pool_id)
+            for token_id, weight in (snapshot.tokenWeights or {}).items():
+                weights["pool_id"].append(pool_id)
+                weights["token_id"].append(token_id)
+                weights["blockNumber"].append(snapshot.blockNumber)
+                weights["timestamp"].append(snapshot.timestamp)
+                weights["weight"].append(weight)
+    return rows, weights
+
+
+def measure(fn, *args):
+    # time and memory held by the result, on top of the inputs
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - start
+    held, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, held / 2**20, peak / 2**20
+
+
+def report(name, elapsed, held, peak):
+    print(f"  {name:>22} {elapsed:>9.2f}s {held:>10.1f} {peak:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pools", type=int, default=500_000)
+    parser.add_argument("--snapshot-pools", type=int, default=10_000)
+    parser.add_argument("--days", type=int, default=120)
+    args = parser.parse_args()
+
+    subgraph = Subgraph("Stub", "DEX AMM", "stub")
+    header = f"  {'':>22} {'time':>10} {'held (MiB)':>10} {'peak (MiB)':>10}"
+
+    result = make_pools(args.pools)
+    print(f"{args.pools} pools")
+    print(header)
+    params = subgraph._pools_params()
+    legacy, *stats = measure(legacy_parse_pools, result)
+    report("dataclasses", *stats)
+    del legacy
+    pools, *stats = measure(subgraph._parse_pools, result, params)
+    report("slotted", *stats)
+    del pools, result
+
+    raw_pools = make_pools(args.snapshot_pools)
+    pool_ids = [pool["id"] for pool in raw_pools]
+    data = [
+        snapshot for pool in raw_pools for snapshot in make_snapshots(pool, args.days)
+    ]
+    blocks = [15_000_000 + day * BLOCKS_PER_DAY for day in range(args.days)]
+    params = subgraph._snapshots_many_params(pool_ids, blocks)
+    print(f"{args.snapshot_pools} pools, {len(data)} snapshots")
+    print(header)
+    legacy, *stats = measure(legacy_split, pool_ids, data, params, blocks)
+    report("dataclasses", *stats)
+    (legacy_snapshots, legacy_weights), *stats = measure(legacy_rows, legacy)
+    report("dataclasses to rows", *stats)
+    del legacy
+    batch, *stats = measure(subgraph._split, pool_ids, data, params, blocks)
+    report("columnar", *stats)
+    (snapshots, weights), *stats = measure(
+        lambda batch: (batch.rows(), batch.weight_rows()), batch
+    )
+    report("columnar to rows", *stats)
+
+    # both produce the same rows, converted to lists as the upserts do
+    assert {name: column.tolist() for name, column in snapshots.items()} == (
+        legacy_snapshots
+    )
+    assert {name: column.tolist() for name, column in weights.items()} == (
+        legacy_weights
+    )
+
+
+if __name__ == "__main__":
+    main()
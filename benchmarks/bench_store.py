@@ -0,0 +1,63 @@
+"""Compare daily returns read from the pool data store against the database.
+
+Builds a store of the snapshots in the database configured for
+`database.engine` in a temporary directory, e.g.
+
+POSTGRES_HOST=localhost python benchmarks/bench_store.py --days 120 210 400
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(1, os.path.join(sys.path[0], ".."))
+sys.path.insert(1, os.path.join(sys.path[0], "..", "reports", "frontier"))
+
+import preprocess
+from database.pool_data import DAY, snapshot_watermark
+from database.store import PoolDataStore
+
+
+def measure(start, end, watermark):
+    begin = time.perf_counter()
+    returns = preprocess._daily_returns(start, end, watermark)
+    return time.perf_counter() - begin, returns
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, nargs="+", default=[120, 210, 400])
+    args = parser.parse_args()
+
+    watermark = snapshot_watermark()
+    end = watermark["timestamp"] - watermark["timestamp"] % DAY + DAY
+    with tempfile.TemporaryDirectory() as path:
+        store = PoolDataStore(path)
+        start = time.perf_counter()
+        store.update()
+        print(f"filled store in {time.perf_counter() - start:.2f}s")
+        start = time.perf_counter()
+        store.update(end - 2 * DAY, end)
+        print(f"re-read 2 days in {time.perf_counter() - start:.2f}s")
+
+        print(f"{'days':>5} {'database (s)':>13} {'store (s)':>10}")
+        for days in args.days:
+            preprocess.pool_data_store = PoolDataStore(os.path.join(path, "empty"))
+            database, expected = measure(end - days * DAY, end, watermark)
+            preprocess.pool_data_store = store
+            stored, returns = measure(end - days * DAY, end, watermark)
+            print(f"{days:>5} {database:>13.3f} {stored:>10.3f}")
+
+            # both sources give the same returns
+            for old, new in zip(expected[1:], returns[1:]):
+                assert old.index.equals(new.index)
+                assert list(old.columns) == list(new.columns)
+                assert np.allclose(old, new, equal_nan=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Compare materialized and streamed pool ingestion against a stub subgraph.
+
+Reports the peak memory traced in the process, the time until the first page
+of pools is processed and the total time, with `--work` seconds of pricing
+and database writes simulated per page.
+
+python benchmarks/bench_streaming.py --pools 500000 --work 0.01
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(1, os.path.join(sys.path[0], ".."))
+
+from stub_subgraph import StubSubgraph
+
+import messari.subgraphs
+from messari.fetch import fetch_pools, iter_pools
+from messari.queries import PAGE_SIZE
+from messari.subgraphs import Subgraph
+
+
+def process(pools, work):
+    # stands in for pricing the tokens and writing the pools
+    time.sleep(work)
+    return len({token.id for pool in pools for token in pool.tokens})
+
+
+async def materialized(subgraphs, work):
+    all_pools = await fetch_pools(subgraphs)
+    first, count = None, 0
+    for pools in all_pools.values():
+        for idx in range(0, len(pools), PAGE_SIZE):
+            await asyncio.to_thread(process, pools[idx : idx + PAGE_SIZE], work)
+            first = first or time.perf_counter()
+            count += len(pools[idx : idx + PAGE_SIZE])
+    return first, count
+
+
+async def streamed(subgraphs, work):
+    first, count = None, 0
+    async for _, pools in iter_pools(subgraphs):
+        await asyncio.to_thread(process, pools, work)
+        first = first or time.perf_counter()
+        count += len(pools)
+    return first, count
+
+
+def measure(fn, subgraphs, work):
+    tracemalloc.start()
+    start = time.perf_counter()
+    first, count = asyncio.run(fn(subgraphs, work))
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return count, first - start, elapsed, peak / 2**20
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--subgraphs", type=int, default=1)
+    parser.add_argument("--pools", type=int, default=500000)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--work", type=float, default=0.01)
+    args = parser.parse_args()
+
+    with StubSubgraph(num_pools=args.pools, num_days=1, latency=args.latency) as url:
+        messari.subgraphs.BASE_URL = url
+        subgraphs = [
+            Subgraph(f"Stub {idx}", "DEX AMM", f"stub-{idx}")
+            for idx in range(args.subgraphs)
+        ]
+
+        print(f"{'impl':>12} {'pools':>8} {'first (s)':>10} {'total (s)':>10}", end="")
+        print(f" {'peak (MiB)':>11}")
+        for name, fn in [("materialized", materialized), ("streamed", streamed)]:
+            count, first, elapsed, peak = measure(fn, subgraphs, args.work)
+            assert count == args.pools * args.subgraphs
+            print(
+                f"{name:>12} {count:>8} {first:>10.2f} {elapsed:>10.2f} {peak:>11.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
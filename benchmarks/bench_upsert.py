@@ -0,0 +1,104 @@
+"""Compare per-row ORM writes with bulk upserts of pool snapshots.
+
+Runs against the database configured for `database.engine`, e.g.
+
+POSTGRES_HOST=localhost python benchmarks/bench_upsert.py --rows 100000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+from sqlmodel import Session, delete
+
+sys.path.insert(1, os.path.join(sys.path[0], ".."))
+
+from database.bulk import upsert
+from database.engine import engine
+from database.models import Pool, PoolSnapshot
+
+POOLS = 1000
+
+
+def make_rows(num_rows, offset=0):
+    rows = {
+        "id": [],
+        "blockNumber": [],
+        "timestamp": [],
+        "totalValueLocked": [],
+        "cumulativeReward": [],
+        "pool_id": [],
+    }
+    for idx in range(num_rows):
+        pool_id = f"bench_{idx % POOLS}"
+        block = 15_000_000 + (idx // POOLS + offset) * 7200
+        rows["id"].append(f"{pool_id}_{block}")
+        rows["blockNumber"].append(block)
+        rows["timestamp"].append(1_650_000_000 + (idx // POOLS) * 86400)
+        rows["totalValueLocked"].append(1e6 + idx)
+        rows["cumulativeReward"].append(1e2 * idx)
+        rows["pool_id"].append(pool_id)
+    return rows
+
+
+def legacy_write(rows):
+    # session.get for every row before adding it, as the exporters used to do
+    with Session(engine) as session:
+        for values in zip(*rows.values()):
+            snapshot = PoolSnapshot(**dict(zip(rows, values)))
+            if session.get(PoolSnapshot, snapshot.id) is not None:
+                continue
+            session.add(snapshot)
+        session.commit()
+
+
+def bulk_write(rows):
+    with Session(engine) as session:
+        upsert(session, PoolSnapshot, rows)
+        session.commit()
+
+
+def cleanup():
+    with engine.begin() as connection:
+        connection.execute(
+            delete(PoolSnapshot).where(PoolSnapshot.pool_id.like("bench_%"))
+        )
+        connection.execute(delete(Pool).where(Pool.id.like("bench_%")))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100_000)
+    args = parser.parse_args()
+
+    cleanup()
+    with Session(engine) as session:
+        upsert(
+            session,
+            Pool,
+            {
+                "id": [f"bench_{idx}" for idx in range(POOLS)],
+                "name": [f"Bench {idx}" for idx in range(POOLS)],
+                "protocol": ["Bench"] * POOLS,
+            },
+        )
+        session.commit()
+
+    try:
+        for name, write in [("legacy", legacy_write), ("bulk", bulk_write)]:
+            # insert new rows, then write the same rows again
+            rows = make_rows(args.rows, offset=0 if name == "legacy" else 10_000)
+            start = time.perf_counter()
+            write(rows)
+            inserted = time.perf_counter() - start
+            start = time.perf_counter()
+            write(rows)
+            rewritten = time.perf_counter() - start
+            print(f"{name:>6}: insert {inserted:.2f}s, rewrite {rewritten:.2f}s")
+    finally:
+        cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""Local stub of a Messari DEX subgraph, used by the benchmarks.
+
+Serves liquidity pools and their daily snapshots, generated on demand, with an
+artificial latency per request, on every path so that any endpoint name works.
+"""
+
+import asyncio
+import threading
+
+from aiohttp import web
+from graphql import build_schema, graphql
+
+SDL = """
+scalar BigInt
+scalar BigDecimal
+
+type Token {
+    id: ID!
+    name: String!
+    symbol: String!
+}
+
+type LiquidityPool {
+    id: ID!
+    name: String!
+    inputTokens: [Token!]!
+    inputTokenWeights: [BigDecimal!]!
+}
+
+type LiquidityPoolDailySnapshot {
+    id: ID!
+    pool: LiquidityPool!
+    blockNumber: BigInt!
+    timestamp: BigInt!
+    totalValueLockedUSD: BigDecimal!
+    cumulativeSupplySideRevenueUSD: BigDecimal!
+    inputTokenWeights: [BigDecimal!]!
+}
+
+input LiquidityPool_filter {
+    id_gt: ID
+}
+
+input LiquidityPoolDailySnapshot_filter {
+    id_gt: ID
+    pool: String
+    pool_in: [String!]
+    blockNumber_gte: BigInt
+    blockNumber_lte: BigInt
+}
+
+type Query {
+    liquidityPool(id: ID!): LiquidityPool
+    liquidityPools(
+        first: Int = 100
+        where: LiquidityPool_filter
+    ): [LiquidityPool!]!
+    liquidityPoolDailySnapshots(
+        first: Int = 100
+        where: LiquidityPoolDailySnapshot_filter
+    ): [LiquidityPoolDailySnapshot!]!
+}
+"""
+
+BLOCKS_PER_DAY = 7200
+SECONDS_PER_DAY = 86400
+
+
+def make_pool(idx):
+    tokens = [
+        {"id": f"0x{2 * idx:040x}", "name": f"Token {2 * idx}", "symbol": "A"},
+        {
+            "id": f"0x{2 * idx + 1:040x}",
+            "name": f"Token {2 * idx + 1}",
+            "symbol": "B",
+        },
+    ]
+    return {
+        "id": f"0x{idx:040x}",
+        "name": f"Pool {idx}",
+        "inputTokens": tokens,
+        "inputTokenWeights": ["50", "50"],
+    }
+
+
+def make_pools(num_pools):
+    return [make_pool(idx) for idx in range(num_pools)]
+
+
+def make_snapshots(pool, num_days, start_block=15_000_000):
+    return [
+        {
+            "id": f"{pool['id']}-{day:05d}",
+            "pool": pool,
+            "blockNumber": str(start_block + day * BLOCKS_PER_DAY + 17),
+            "timestamp": str(1_650_000_000 + day * SECONDS_PER_DAY + 211),
+            "totalValueLockedUSD": str(1e6 + 1e3 * day),
+            "cumulativeSupplySideRevenueUSD": str(1e2 * day),
+            "inputTokenWeights": ["50", "50"],
+        }
+        for day in range(num_days)
+    ]
+
+
+class StubSubgraph:
+    """Runs the stub GraphQL server in a background thread.
+
+    Use as a context manager; it yields the base url to prepend to endpoints.
+    """
+
+    def __init__(self, num_pools=1000, num_days=120, latency=0.05):
+        self.latency = latency
+        self.requests = 0
+        self.num_pools = num_pools
+        self.num_days = num_days
+        self.schema = build_schema(SDL)
+        self.root = {
+            "liquidityPool": self.liquidity_pool,
+            "liquidityPools": self.liquidity_pools,
+            "liquidityPoolDailySnapshots": self.daily_snapshots,
+        }
+
+    def _index(self, pool_id):
+        # pools are generated on demand from the index encoded in their id
+        try:
+            idx = int(pool_id, 16)
+        except (TypeError, ValueError):
+            return None
+        if pool_id != f"0x{idx:040x}" or idx >= self.num_pools:
+            return None
+        return idx
+
+    def liquidity_pool(self, info, id):
+        idx = self._index(id)
+        return None if idx is None else make_pool(idx)
+
+    def liquidity_pools(self, info, first=100, where=None):
+        skip_id = (where or {}).get("id_gt") or ""
+        # ids have a fixed width, so they sort like their indexes
+        idx = 0 if skip_id == "" else int(skip_id, 16) + 1
+        return [make_pool(idx) for idx in range(idx, min(idx + first, self.num_pools))]
+
+    def daily_snapshots(self, info, first=100, where=None):
+        where = where or {}
+        pool_ids = where.get("pool_in") or [where.get("pool")]
+        skip_id = where.get("id_gt") or ""
+        lo = int(where.get("blockNumber_gte", 0))
+        hi = int(where.get("blockNumber_lte", 2**63))
+        # snapshot ids are prefixed with the pool id, so this is sorted by id
+        indexes = [self._index(pool_id) for pool_id in sorted(pool_ids)]
+        data = [
+            snapshot
+            for idx in indexes
+            if idx is not None
+            for snapshot in make_snapshots(make_pool(idx), self.num_days)
+            if snapshot["id"] > skip_id and lo <= int(snapshot["blockNumber"]) <= hi
+        ]
+        return data[:first]
+
+    async def handle(self, request):
+        self.requests += 1
+        payload = await request.json()
+        await asyncio.sleep(self.latency)
+        result = await graphql(
+            self.schema,
+            payload["query"],
+            root_value=self.root,
+            variable_values=payload.get("variables"),
+            operation_name=payload.get("operationName"),
+        )
+        response = {"data": result.data}
+        if result.errors:
+            response["errors"] = [error.formatted for error in result.errors]
+        return web.json_response(response)
+
+    def __enter__(self):
+        self.loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        async def start():
+            app = web.Application()
+            app.router.add_post("/{endpoint:.*}", self.handle)
+            self.runner = web.AppRunner(app, access_log=None)
+            await self.runner.setup()
+            site = web.TCPSite(self.runner, "127.0.0.1", 0)
+            await site.start()
+            self.port = site._server.sockets[0].getsockname()[1]
+            started.set()
+
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(start(), self.loop)
+        started.wait()
+        return f"http://127.0.0.1:{self.port}/"
+
+    def __exit__(self, *args):
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
@@ -0,0 +1,46 @@
+import numpy as np
+from sqlalchemy.dialects.postgresql import insert
+
+__all__ = ["upsert"]
+
+BATCH_SIZE = 5000
+
+
+def upsert(session, model, columns, update=None, batch_size=BATCH_SIZE):
+    """Insert columnar rows with batched `INSERT ... ON CONFLICT` statements.
+
+    `columns` maps column names to sequences of equal length, with numpy
+    arrays converted to Python values one batch at a time. On a primary
+    key conflict the columns listed in `update` (all non-key columns by
+    default) are overwritten with the new values. `update` may also be a
+    callable taking the table and the `excluded` row and returning the
+    `SET` clause. Returns the number of rows written.
+    """
+    table = model.__table__
+    primary_key = [column.name for column in table.primary_key]
+    names = list(columns)
+    if update is None:
+        update = [name for name in names if name not in primary_key]
+
+    count = len(columns[names[0]]) if len(names) > 0 else 0
+    for start in range(0, count, batch_size):
+        values = [columns[name][start : start + batch_size] for name in names]
+        values = [
+            value.tolist() if isinstance(value, np.ndarray) else value
+            for value in values
+        ]
+        rows = [dict(zip(names, row)) for row in zip(*values)]
+
+        statement = insert(table)
+        if callable(update):
+            set_ = update(table, statement.excluded)
+        else:
+            set_ = {name: statement.excluded[name] for name in update}
+        if len(set_) > 0:
+            statement = statement.on_conflict_do_update(
+                index_elements=primary_key, set_=set_
+            )
+        else:
+            statement = statement.on_conflict_do_nothing(index_elements=primary_key)
+        session.exec(statement, params=rows)
+    return count
@@ -2,6 +2,7 @@ import os
 
 from sqlmodel import SQLModel, create_engine
 
+from database.migrations import migrate
 from database.models import *
 
 __all__ = ["engine"]
@@ -14,3 +15,4 @@ db = os.environ.get("POSTGRES_DATABASE", "postgres")
 database_uri = f"postgresql://{pguser}:{passwd}@{pghost}:5432/{db}"
 engine = create_engine(database_uri)
 SQLModel.metadata.create_all(engine)
+migrate(engine)
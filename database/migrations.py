@@ -0,0 +1,74 @@
+import logging
+import time
+
+from sqlalchemy import func, inspect, select, text
+from sqlalchemy.exc import IntegrityError, ProgrammingError
+from sqlalchemy.schema import CreateIndex, DropIndex
+from sqlmodel import SQLModel
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_LOCK = 0x6D696772  # advisory lock key shared by all services
+
+
+def _invalid_indexes(connection, table):
+    # indexes left behind by interrupted concurrent builds
+    statement = text(
+        "SELECT c.relname FROM pg_index i "
+        "JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE i.indrelid = CAST(:table AS regclass) AND NOT i.indisvalid"
+    )
+    return set(connection.execute(statement, {"table": table}).scalars().all())
+
+
+def _create_index(connection, index):
+    index.dialect_kwargs["postgresql_concurrently"] = True
+    try:
+        connection.execute(CreateIndex(index, if_not_exists=True))
+    except (IntegrityError, ProgrammingError) as e:
+        # another database client created it meanwhile
+        if index.name not in {
+            existing["name"]
+            for existing in inspect(connection).get_indexes(index.table.name)
+        }:
+            raise
+        logger.info(f"Index {index.name} already exists: {e.orig}")
+    finally:
+        del index.dialect_kwargs["postgresql_concurrently"]
+
+
+def migrate(engine):
+    """Create the indexes declared on tables that already exist.
+
+    `create_all` only creates the indexes of new tables. Missing indexes are
+    built concurrently so that the exporters can keep writing meanwhile, and
+    invalid indexes of interrupted builds are rebuilt. The services migrate
+    one at a time under an advisory lock.
+    """
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        # poll, as a blocked statement holds a snapshot that the concurrent
+        # index builds of the lock holder would wait for
+        lock = select(func.pg_try_advisory_lock(MIGRATION_LOCK))
+        while not connection.execute(lock).scalar():
+            time.sleep(1)
+        try:
+            inspector = inspect(connection)
+            for table in SQLModel.metadata.sorted_tables:
+                existing = {
+                    index["name"] for index in inspector.get_indexes(table.name)
+                }
+                invalid = _invalid_indexes(connection, table.name)
+                for index in table.indexes:
+                    if index.name in invalid:
+                        logger.info(f"Rebuilding invalid index {index.name}")
+                        index.dialect_kwargs["postgresql_concurrently"] = True
+                        try:
+                            connection.execute(DropIndex(index, if_exists=True))
+                        finally:
+                            del index.dialect_kwargs["postgresql_concurrently"]
+                    elif index.name in existing:
+                        continue
+                    logger.info(f"Creating index {index.name}")
+                    _create_index(connection, index)
+        finally:
+            connection.execute(select(func.pg_advisory_unlock(MIGRATION_LOCK)))
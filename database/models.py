@@ -1,5 +1,6 @@
 from typing import Optional
 
+from sqlalchemy import Index
 from sqlmodel import Field, Relationship, SQLModel
 
 
@@ -42,6 +43,19 @@ class PoolSnapshot(SQLModel, table=True):
     )
 
 
+# pool history loaded by the reports, and the top pools by tvl at a block
+Index(
+    "ix_poolsnapshot_pool_id_timestamp",
+    PoolSnapshot.__table__.c.pool_id,
+    PoolSnapshot.__table__.c.timestamp,
+)
+Index(
+    "ix_poolsnapshot_blocknumber_tvl",
+    PoolSnapshot.__table__.c.blockNumber,
+    PoolSnapshot.__table__.c.totalValueLocked.desc(),
+)
+
+
 class Token(SQLModel, table=True):
     id: str = Field(primary_key=True)
     name: str
@@ -67,3 +81,43 @@ class TokenSnapshot(SQLModel, table=True):
         back_populates="snapshots",
         sa_relationship_kwargs={"cascade": "all, delete"},
     )
+
+
+# price history of a token
+Index(
+    "ix_tokensnapshot_token_id_timestamp",
+    TokenSnapshot.__table__.c.token_id,
+    TokenSnapshot.__table__.c.timestamp,
+)
+
+
+class PoolTokenWeight(SQLModel, table=True):
+    # weight of a pool token at a daily pool snapshot
+    pool_id: str = Field(foreign_key="pool.id", primary_key=True)
+    token_id: str = Field(primary_key=True)
+    blockNumber: int = Field(
+        primary_key=True, sa_column_kwargs={"autoincrement": False}
+    )
+    timestamp: int
+    weight: float
+
+
+# token weights of a pool loaded by the reports
+Index(
+    "ix_pooltokenweight_pool_id_timestamp",
+    PoolTokenWeight.__table__.c.pool_id,
+    PoolTokenWeight.__table__.c.timestamp,
+)
+
+
+class ExportWatermark(SQLModel, table=True):
+    # range of days exported so far for a pool or a token
+    kind: str = Field(primary_key=True)
+    id: str = Field(primary_key=True)
+    start: int
+    end: int
+
+
+class Block(SQLModel, table=True):
+    number: int = Field(primary_key=True, sa_column_kwargs={"autoincrement": False})
+    timestamp: int
@@ -0,0 +1,225 @@
+import numpy as np
+import pandas as pd
+from sqlmodel import Session, func, select
+
+from database.engine import engine
+from database.models import (
+    ExportWatermark,
+    Pool,
+    PoolSnapshot,
+    PoolTokenLink,
+    PoolTokenWeight,
+    TokenSnapshot,
+)
+
+__all__ = ["DAY", "dense_levels", "load_pool_data", "snapshot_watermark"]
+
+DAY = 24 * 60 * 60
+
+
+def _read_frame(session, statement):
+    result = session.exec(statement)
+    return pd.DataFrame(result.all(), columns=list(result.keys()))
+
+
+def _token_weights(prices, token_weights):
+    # normalized token weights of the day, taken from the nearest day with
+    # weights of the pool, and uniform if the pool has none for all its tokens
+    prices = prices.reset_index().sort_values("timestamp", kind="stable")
+    token_weights = token_weights.astype(
+        {"pool_id": str, "token_id": str, "timestamp": np.int64, "weight": float}
+    )
+    weights = pd.merge_asof(
+        prices[["index", "pool_id", "token_id", "timestamp"]],
+        token_weights.sort_values("timestamp", kind="stable"),
+        on="timestamp",
+        by=["pool_id", "token_id"],
+        direction="nearest",
+    )
+    weights = weights.set_index("index")["weight"].sort_index()
+    prices = prices.set_index("index").sort_index()
+
+    keys = [prices["pool_id"], prices["timestamp"]]
+    count = weights.groupby(keys).transform("count")
+    total = weights.groupby(keys).transform("sum")
+    valid = (count == prices["num_tokens"]) & (total > 0)
+    return (weights / total).where(valid, 1 / prices["num_tokens"])
+
+
+def _day(timestamp):
+    # start of the utc day of a timestamp column
+    return timestamp - timestamp % DAY
+
+
+def snapshot_watermark():
+    # latest exported snapshots and the exported ranges, changing with new data
+    with Session(engine) as session:
+        latest_block = select(func.max(PoolSnapshot.blockNumber)).scalar_subquery()
+        statement = select(latest_block, func.max(PoolSnapshot.timestamp)).where(
+            PoolSnapshot.blockNumber == latest_block
+        )
+        block, timestamp = session.exec(statement).one()
+        statement = select(
+            func.count(), func.sum(ExportWatermark.start), func.sum(ExportWatermark.end)
+        )
+        ranges = [int(value or 0) for value in session.exec(statement).one()]
+    return {"block": block, "timestamp": timestamp, "ranges": ranges}
+
+
+def load_pool_data(start, end, all_pools=False):
+    """Load daily pool prices, tvls and rewards between `start` and `end`.
+
+    Only the last snapshot of each day in `[start, end)` is read for every
+    pool and token, indexed by the start of its day. Pool prices are weighted
+    by the token weights exported for that day. Pools without snapshots in
+    the window are skipped unless `all_pools` is set.
+    """
+    with Session(engine) as session:
+        # pools with snapshots in the window and their tokens
+        has_snapshots = (
+            select(PoolSnapshot.pool_id)
+            .where(
+                PoolSnapshot.pool_id == Pool.id,
+                PoolSnapshot.timestamp >= start,
+                PoolSnapshot.timestamp < end,
+            )
+            .exists()
+        )
+        statement = select(Pool.id, Pool.name, Pool.protocol)
+        if not all_pools:
+            statement = statement.where(has_snapshots)
+        pools = _read_frame(session, statement).rename(columns={"id": "pool_id"})
+        statement = select(PoolTokenLink.pool_id, PoolTokenLink.token_id)
+        pool_tokens = _read_frame(session, statement).merge(pools, on="pool_id")
+
+        # last token prices of each day
+        day = _day(TokenSnapshot.timestamp)
+        statement = (
+            select(TokenSnapshot.token_id, day.label("timestamp"), TokenSnapshot.price)
+            .distinct(TokenSnapshot.token_id, day)
+            .where(
+                TokenSnapshot.token_id.in_(select(PoolTokenLink.token_id)),
+                TokenSnapshot.price != None,
+                TokenSnapshot.timestamp >= start,
+                TokenSnapshot.timestamp < end,
+            )
+            .order_by(TokenSnapshot.token_id, day, TokenSnapshot.timestamp.desc())
+        )
+        token_prices = _read_frame(session, statement)
+
+        # last token weights of each day, and of the nearest days outside of
+        # the window, so that prices do not depend on the days read
+        day = _day(PoolTokenWeight.timestamp)
+        columns = [
+            PoolTokenWeight.pool_id,
+            PoolTokenWeight.token_id,
+            day.label("timestamp"),
+            PoolTokenWeight.weight,
+        ]
+        statement = (
+            select(*columns)
+            .distinct(PoolTokenWeight.pool_id, PoolTokenWeight.token_id, day)
+            .where(
+                PoolTokenWeight.timestamp >= start,
+                PoolTokenWeight.timestamp < end,
+            )
+            .order_by(
+                PoolTokenWeight.pool_id,
+                PoolTokenWeight.token_id,
+                day,
+                PoolTokenWeight.timestamp.desc(),
+            )
+        )
+        token_weights = [_read_frame(session, statement)]
+        for outside, nearest in [
+            (PoolTokenWeight.timestamp < start, day.desc()),
+            (PoolTokenWeight.timestamp >= end, day),
+        ]:
+            statement = (
+                select(*columns)
+                .distinct(PoolTokenWeight.pool_id, PoolTokenWeight.token_id)
+                .where(outside)
+                .order_by(
+                    PoolTokenWeight.pool_id,
+                    PoolTokenWeight.token_id,
+                    nearest,
+                    PoolTokenWeight.timestamp.desc(),
+                )
+            )
+            token_weights.append(_read_frame(session, statement))
+        token_weights = pd.concat(token_weights, ignore_index=True)
+
+        # last pool tvl and rewards of each day
+        day = _day(PoolSnapshot.timestamp)
+        statement = (
+            select(
+                PoolSnapshot.pool_id,
+                day.label("timestamp"),
+                PoolSnapshot.totalValueLocked,
+                PoolSnapshot.cumulativeReward,
+            )
+            .distinct(PoolSnapshot.pool_id, day)
+            .where(
+                PoolSnapshot.pool_id != None,
+                PoolSnapshot.timestamp >= start,
+                PoolSnapshot.timestamp < end,
+            )
+            .order_by(PoolSnapshot.pool_id, day, PoolSnapshot.timestamp.desc())
+        )
+        pool_snapshots = _read_frame(session, statement)
+
+    # weighted pool prices, missing where any of the token prices is missing
+    pool_tokens["num_tokens"] = pool_tokens.groupby("pool_id")["token_id"].transform(
+        "size"
+    )
+    prices = pool_tokens.merge(token_prices, on="token_id")
+    prices["weight"] = _token_weights(prices, token_weights)
+    prices["price"] = prices["price"].astype(float) * prices["weight"]
+    prices = prices.groupby(["pool_id", "timestamp"]).agg(
+        price=("price", "sum"),
+        count=("price", "count"),
+        num_tokens=("num_tokens", "first"),
+    )
+    prices.loc[prices["count"] < prices["num_tokens"], "price"] = np.nan
+    prices = prices["price"].unstack("pool_id")
+
+    # skip pools without any token prices
+    pools = pools.sort_values("pool_id").set_index("pool_id")
+    pools = pools[pools.index.isin(prices.columns)]
+
+    snapshots = pool_snapshots.pivot(
+        index="timestamp",
+        columns="pool_id",
+        values=["totalValueLocked", "cumulativeReward"],
+    ).astype(float)
+
+    # prices, tvls and rewards of each pool as adjacent columns
+    pool_data = pd.concat(
+        [prices, snapshots["totalValueLocked"], snapshots["cumulativeReward"]],
+        axis=1,
+        keys=["price", "tvl", "reward"],
+    ).sort_index()
+    pool_data = pool_data.swaplevel(axis=1).reindex(
+        columns=pd.MultiIndex.from_product([pools.index, ["price", "tvl", "reward"]])
+    )
+    pool_data.columns = np.repeat(pools["name"].to_numpy(), 3)
+
+    pool_info = pools.reset_index().rename(columns={"pool_id": "id"})
+    pool_info = pool_info.to_dict("records")
+    return pool_info, pool_data
+
+
+def dense_levels(pool_data, start, end):
+    """Return the days in `[start, end)` and the pool levels of every day.
+
+    Levels of `load_pool_data` are returned as one array of shape
+    `(3, days, pools)` for the prices, tvls and rewards, with NaN on the days
+    a pool has no data.
+    """
+    days = np.arange(start, end, DAY, dtype=np.int64)
+    num_pools = pool_data.shape[1] // 3
+    levels = np.full((3, len(days), num_pools), np.nan)
+    values = pool_data.to_numpy(dtype=float).reshape(len(pool_data), num_pools, 3)
+    rows = (pool_data.index.to_numpy(dtype=np.int64) - start) // DAY
+    levels[:, rows, :] = values.transpose(2, 0, 1)
+    return days, levels
@@ -0,0 +1,168 @@
+import fcntl
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+import numpy as np
+from sqlmodel import Session, func, select
+
+from database.engine import engine
+from database.models import PoolSnapshot
+from database.pool_data import DAY, dense_levels, load_pool_data, snapshot_watermark
+from messari.cache import CACHE_DIR, atomic_write, prune
+
+__all__ = ["PoolDataStore", "pool_data_store"]
+
+logger = logging.getLogger(__name__)
+
+STORE_DIR = os.path.join(CACHE_DIR, "pool_data")
+STORE_VERSIONS = 2  # versions kept for readers still mapping an older one
+
+
+class PoolDataStore:
+    """Daily pool prices, tvls and rewards as memory-mapped day by pool matrices.
+
+    The levels are one float64 array of shape `(3, days, pools)`, NaN where a
+    pool has no data, stored next to an index of its first day, the pools of
+    its columns and the snapshot watermark it is up to date with. Updates
+    re-read only the given days from the database and write a new version,
+    which readers switch to atomically.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    @contextmanager
+    def _lock(self):
+        # serialize updates from the exporters sharing the cache volume
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, "lock"), "w") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def load(self):
+        """Return the index and the memory-mapped levels, or None if empty."""
+        try:
+            with open(os.path.join(self.path, "CURRENT")) as f:
+                path = os.path.join(self.path, f.read().strip())
+            with open(os.path.join(path, "index.json")) as f:
+                index = json.load(f)
+            levels = np.load(os.path.join(path, "levels.npy"), mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+        return index, levels
+
+    def window(self, start, end, watermark):
+        """Return the pools, days and levels in `[start, end)`.
+
+        Returns None unless the store is up to date with the snapshot
+        watermark. Only the rows of the window are read from the memory map.
+        """
+        stored = self.load()
+        if stored is None:
+            return None
+        index, levels = stored
+        if index["watermark"] != watermark:
+            return None
+
+        # days outside of the store have no data
+        days = np.arange(start, end, DAY, dtype=np.int64)
+        window = np.full((3, len(days), levels.shape[2]), np.nan)
+        first = (start - index["start"]) // DAY
+        rows = slice(max(first, 0), min(first + len(days), levels.shape[1]))
+        if rows.start < rows.stop:
+            window[:, rows.start - first : rows.stop - first] = levels[:, rows]
+        return index["pools"], days, window
+
+    def update(self, start=None, end=None):
+        """Re-read the days in `[start, end)` from the database.
+
+        Reads all days with snapshots if the store is empty or no range is
+        given. Failures to write the store are logged, as readers fall back
+        to the database.
+        """
+        with self._lock():
+            # the watermark before reading, so that newer data invalidates it
+            watermark = snapshot_watermark()
+            stored = self.load()
+            if stored is None or start is None:
+                with Session(engine) as session:
+                    statement = select(
+                        func.min(PoolSnapshot.timestamp),
+                        func.max(PoolSnapshot.timestamp),
+                    )
+                    start, end = session.exec(statement).one()
+                if start is None:
+                    return
+                end += 1
+            start = start - start % DAY
+            end = end - end % DAY + (DAY if end % DAY > 0 else 0)
+
+            if stored is None:
+                index, levels = {"start": start, "pools": []}, np.empty((3, 0, 0))
+            else:
+                index, levels = stored
+            pool_info, pool_data = load_pool_data(start, end, all_pools=True)
+
+            # new pools have token prices before the days read
+            known = {pool["id"] for pool in index["pools"]}
+            if stored is not None and any(
+                pool["id"] not in known for pool in pool_info
+            ):
+                start = min(index["start"], start)
+                end = max(index["start"] + levels.shape[1] * DAY, end)
+                pool_info, pool_data = load_pool_data(start, end, all_pools=True)
+            _, new_levels = dense_levels(pool_data, start, end)
+
+            # extend the days and append new pools as columns
+            pools = {pool["id"]: pool for pool in index["pools"]}
+            pools.update({pool["id"]: pool for pool in pool_info})
+            columns = {pool_id: idx for idx, pool_id in enumerate(pools)}
+            first = min(index["start"], start)
+            last = max(index["start"] + levels.shape[1] * DAY, end)
+            merged = np.full((3, (last - first) // DAY, len(pools)), np.nan)
+            offset = (index["start"] - first) // DAY
+            merged[:, offset : offset + levels.shape[1], : levels.shape[2]] = levels
+
+            # replace the days read for all pools
+            rows = slice((start - first) // DAY, (end - first) // DAY)
+            merged[:, rows] = np.nan
+            idx = [columns[pool["id"]] for pool in pool_info]
+            merged[:, rows, idx] = new_levels
+
+            index = {
+                "start": first,
+                "pools": list(pools.values()),
+                "watermark": watermark,
+            }
+            self._write(index, merged)
+            logger.info(
+                f"Stored {merged.shape[1]} days of {merged.shape[2]} pools, "
+                f"re-read {rows.stop - rows.start} days"
+            )
+
+    def _write(self, index, levels):
+        version = str(time.time_ns())
+        try:
+            # write the version, then switch readers to it
+            with atomic_write(os.path.join(self.path, version), directory=True) as tmp:
+                np.save(os.path.join(tmp, "levels.npy"), levels)
+                with open(os.path.join(tmp, "index.json"), "w") as f:
+                    json.dump(index, f)
+            with atomic_write(os.path.join(self.path, "CURRENT")) as tmp:
+                with open(tmp, "w") as f:
+                    f.write(version)
+        except OSError as e:
+            logger.warning(f"Failed to write pool data store: {e}")
+            return
+
+        # keep only the latest versions
+        prune(self.path, STORE_VERSIONS, str.isdigit)
+
+
+pool_data_store = PoolDataStore(STORE_DIR)
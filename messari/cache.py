@@ -0,0 +1,121 @@
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.environ.get(
+    "CACHE_DIR", os.path.join(os.path.dirname(__file__), "..", "cache")
+)
+SCHEMA_TTL = int(os.environ.get("SUBGRAPH_SCHEMA_TTL", 24 * 60 * 60))
+
+# client reuse counters, shared by the sync and async clients
+stats = Counter()
+
+
+@contextmanager
+def atomic_write(path, directory=False):
+    """Yield a unique temporary path which then replaces `path`.
+
+    The cache volume is shared between services, so each writer gets its own
+    temporary file, or directory if `directory`, next to `path` and readers
+    see either the previous or the complete new content. The temporary path
+    is removed if writing fails. Directories are not replaced once written,
+    so the first writer of a directory wins.
+    """
+    parent = os.path.dirname(path)
+    os.makedirs(parent, exist_ok=True)
+    prefix = os.path.basename(path) + "."
+    if directory:
+        tmp = tempfile.mkdtemp(prefix=prefix, suffix=".tmp", dir=parent)
+    else:
+        fd, tmp = tempfile.mkstemp(prefix=prefix, suffix=".tmp", dir=parent)
+        os.close(fd)
+    try:
+        # readable by the other services, as temporary paths are private
+        os.chmod(tmp, 0o755 if directory else 0o644)
+        yield tmp
+        try:
+            os.replace(tmp, path)
+        except OSError:
+            if not (directory and os.path.isdir(path)):
+                raise
+            _remove(tmp)
+    except BaseException:
+        _remove(tmp)
+        raise
+
+
+def _remove(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def prune(parent, keep, match=None):
+    """Remove all but the `keep` most recently written entries of `parent`.
+
+    Only entries whose name passes `match` are considered, and temporary
+    paths of writes in progress are left alone.
+    """
+    try:
+        entries = [
+            os.path.join(parent, entry)
+            for entry in os.listdir(parent)
+            if not entry.endswith(".tmp") and (match is None or match(entry))
+        ]
+        entries.sort(key=os.path.getmtime, reverse=True)
+    except OSError as e:
+        logger.warning(f"Failed to prune {parent}: {e}")
+        return
+    for entry in entries[keep:]:
+        try:
+            _remove(entry)
+        except OSError:
+            # removed by another service meanwhile
+            pass
+
+
+def _schema_path(endpoint):
+    return os.path.join(CACHE_DIR, "schemas", endpoint + ".json")
+
+
+def load_introspection(endpoint):
+    """Return the cached introspection result of an endpoint, if still fresh."""
+    path = _schema_path(endpoint)
+    try:
+        if time.time() - os.path.getmtime(path) > SCHEMA_TTL:
+            return None
+        with open(path) as f:
+            introspection = json.load(f)
+    except (OSError, ValueError):
+        return None
+    stats["introspections_avoided"] += 1
+    return introspection
+
+
+def save_introspection(endpoint, introspection):
+    stats["introspections"] += 1
+    path = _schema_path(endpoint)
+    try:
+        with atomic_write(path) as tmp, open(tmp, "w") as f:
+            json.dump(introspection, f)
+    except OSError as e:
+        logger.warning(f"Failed to cache schema of {endpoint}: {e}")
+
+
+def summary():
+    return {
+        "requests": stats["requests"],
+        "connections": stats["connections"],
+        # requests sent over a session opened for an earlier request
+        "reused_requests": stats["requests"] - stats["connections"],
+        "introspections": stats["introspections"],
+        "introspections_avoided": stats["introspections_avoided"],
+    }
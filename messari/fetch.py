@@ -0,0 +1,162 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+from gql.transport.aiohttp import log as aiohttp_logger
+
+from messari.cache import stats
+from messari.queries import PAGE_SIZE
+from messari.records import SnapshotBatch
+
+aiohttp_logger.setLevel(logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+class Limiter:
+    """Bounds the number of in-flight requests globally and per endpoint.
+
+    Must be created inside the running event loop.
+    """
+
+    def __init__(self, max_concurrency=16, max_concurrency_per_endpoint=2):
+        self.max_concurrency_per_endpoint = max_concurrency_per_endpoint
+        self._global = asyncio.Semaphore(max_concurrency)
+        self._endpoints = {}
+
+    @asynccontextmanager
+    async def acquire(self, endpoint):
+        if endpoint not in self._endpoints:
+            self._endpoints[endpoint] = asyncio.Semaphore(
+                self.max_concurrency_per_endpoint
+            )
+        async with self._endpoints[endpoint], self._global:
+            yield
+
+
+async def paginate(session, query, params, limiter, endpoint):
+    """Walk `id_gt` pages of a query, yielding one page of results at a time.
+
+    The request for the next page is sent before the current page is yielded,
+    so parsing by the caller overlaps with the next network round trip.
+    """
+
+    async def fetch(skip_id):
+        document, variables = query(params, skip_id)
+        async with limiter.acquire(endpoint):
+            stats["requests"] += 1
+            response = await session.execute(document, variable_values=variables)
+        key = list(response.keys())[0]
+        return response[key]
+
+    next_page = asyncio.ensure_future(fetch(""))
+    try:
+        while True:
+            result = await next_page
+            if len(result) == 0:
+                break
+            # a short page is the last one, so skip the empty terminating page
+            if len(result) < PAGE_SIZE:
+                yield result
+                break
+            next_page = asyncio.ensure_future(fetch(result[-1]["id"]))
+            yield result
+    finally:
+        if not next_page.done():
+            next_page.cancel()
+
+
+async def fetch_pools(subgraphs, max_concurrency=16, max_concurrency_per_endpoint=2):
+    """Fetch the pools of every subgraph in parallel.
+
+    Returns a dict mapping each protocol to its list of pools.
+    """
+    limiter = Limiter(max_concurrency, max_concurrency_per_endpoint)
+
+    async def _fetch(subgraph):
+        try:
+            async with subgraph.session() as session:
+                return await subgraph.fetch_pools(session, limiter)
+        except Exception as e:
+            logger.error(f"Failed to fetch pools from {subgraph.protocol}: {e}")
+            return []
+
+    results = await asyncio.gather(*[_fetch(subgraph) for subgraph in subgraphs])
+    return {subgraph.protocol: pools for subgraph, pools in zip(subgraphs, results)}
+
+
+async def iter_pools(
+    subgraphs, max_pending=4, max_concurrency=16, max_concurrency_per_endpoint=2
+):
+    """Yield `(subgraph, pools)` pages of every subgraph as they arrive.
+
+    Subgraphs are paginated in parallel, but at most `max_pending` pages wait
+    for the caller: when it falls behind, fetching pauses instead of holding
+    every pool in memory.
+    """
+    limiter = Limiter(max_concurrency, max_concurrency_per_endpoint)
+    queue = asyncio.Queue(max_pending)
+
+    async def _fetch(subgraph):
+        try:
+            async with subgraph.session() as session:
+                async for pools in subgraph.aiter_pools(session, limiter):
+                    await queue.put((subgraph, pools))
+        except Exception as e:
+            logger.error(f"Failed to fetch pools from {subgraph.protocol}: {e}")
+        # no more pages from this subgraph
+        await queue.put((subgraph, None))
+
+    tasks = [asyncio.ensure_future(_fetch(subgraph)) for subgraph in subgraphs]
+    try:
+        remaining = len(tasks)
+        while remaining > 0:
+            subgraph, pools = await queue.get()
+            if pools is None:
+                remaining -= 1
+                continue
+            yield subgraph, pools
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def fetch_snapshots(
+    subgraph_pools,
+    blocks,
+    batch_size=50,
+    max_concurrency=16,
+    max_concurrency_per_endpoint=2,
+):
+    """Fetch snapshots for a list of `(subgraph, pool_id)` pairs in parallel.
+
+    A single session is opened per subgraph and shared by all of its pools,
+    which are queried in batches of `batch_size`.
+    Returns the snapshots of all pools as one `SnapshotBatch`.
+    """
+    limiter = Limiter(max_concurrency, max_concurrency_per_endpoint)
+
+    by_subgraph = {}
+    for subgraph, pool_id in subgraph_pools:
+        by_subgraph.setdefault(subgraph.protocol, (subgraph, []))[1].append(pool_id)
+
+    async def _fetch(subgraph, pool_ids):
+        try:
+            async with subgraph.session() as session:
+                results = await asyncio.gather(
+                    *[
+                        subgraph.fetch_snapshots_many(
+                            session, limiter, pool_ids[idx : idx + batch_size], blocks
+                        )
+                        for idx in range(0, len(pool_ids), batch_size)
+                    ]
+                )
+        except Exception as e:
+            logger.error(f"Failed to fetch snapshots from {subgraph.protocol}: {e}")
+            return SnapshotBatch.empty()
+        return SnapshotBatch.concat(results)
+
+    results = await asyncio.gather(
+        *[_fetch(subgraph, pool_ids) for subgraph, pool_ids in by_subgraph.values()]
+    )
+    return SnapshotBatch.concat(results)
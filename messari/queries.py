@@ -1,10 +1,17 @@
 import logging
 from dataclasses import dataclass
+from functools import lru_cache
 
 from gql import gql
 
 logger = logging.getLogger(__name__)
 
+PAGE_SIZE = 1000
+
+# documents are parsed once per schema type and take the pool ids, block
+# ranges and page cursors as variables, so queries return a document and its
+# variables to execute with
+
 
 @dataclass
 class QueryPoolsParams:
@@ -12,19 +19,20 @@ class QueryPoolsParams:
     tokens: str
 
 
-def query_pools(params: QueryPoolsParams, skip_id: str = ""):
+@lru_cache(maxsize=None)
+def _pools_document(pools: str, tokens: str):
     return gql(
         f"""
-        {{
-            {params.pools} (
-                first: 1000,
+        query Pools($skip: ID!) {{
+            {pools} (
+                first: {PAGE_SIZE},
                 where: {{
-                    id_gt: "{skip_id}"
+                    id_gt: $skip
                 }}
             ) {{
                 id
                 name
-                {params.tokens} {{
+                {tokens} {{
                     id
                     name
                     symbol
@@ -35,6 +43,11 @@ def query_pools(params: QueryPoolsParams, skip_id: str = ""):
     )
 
 
+def query_pools(params: QueryPoolsParams, skip_id: str = ""):
+    document = _pools_document(params.pools, params.tokens)
+    return document, {"skip": skip_id}
+
+
 @dataclass
 class QueryAPYParams:
     snapshots: str
@@ -42,32 +55,119 @@ class QueryAPYParams:
     pool_id: str
     from_block: int
     to_block: int
+    tokens: str = ""
+    token_weights: str = ""
+
+
+def _token_weights_fields(pool, tokens, token_weights) -> str:
+    # token weights of the snapshot and the pool tokens they refer to
+    if token_weights == "":
+        return ""
+    return f"""
+                {token_weights}
+                {pool} {{
+                    {tokens} {{
+                        id
+                    }}
+                }}
+    """
+
+
+@lru_cache(maxsize=None)
+def _apy_document(snapshots: str, pool: str, tokens: str, token_weights: str):
+    return gql(
+        f"""
+        query Snapshots(
+            $skip: ID!, $pool: String!, $from: BigInt!, $to: BigInt!
+        ) {{
+            {snapshots} (
+                first: {PAGE_SIZE},
+                where: {{
+                    id_gt: $skip
+                    {pool}: $pool
+                    blockNumber_gte: $from
+                    blockNumber_lte: $to
+                }}
+            ) {{
+                id
+                blockNumber
+                timestamp
+                totalValueLockedUSD
+                cumulativeSupplySideRevenueUSD
+                {_token_weights_fields(pool, tokens, token_weights)}
+            }}
+        }}
+        """
+    )
 
 
 def query_apy(params: QueryAPYParams, skip_id=""):
+    document = _apy_document(
+        params.snapshots, params.pool, params.tokens, params.token_weights
+    )
+    # big ints are sent as strings, as the subgraphs parse them
+    return document, {
+        "skip": skip_id,
+        "pool": params.pool_id,
+        "from": str(params.from_block),
+        "to": str(params.to_block),
+    }
+
+
+@dataclass
+class QueryAPYManyParams:
+    snapshots: str
+    pool: str
+    pool_ids: list[str]
+    from_block: int
+    to_block: int
+    tokens: str = ""
+    token_weights: str = ""
+
+
+@lru_cache(maxsize=None)
+def _apy_many_document(snapshots: str, pool: str, tokens: str, token_weights: str):
     return gql(
         f"""
-        {{
-            {params.snapshots} (
-                first: 1000,
+        query SnapshotsMany(
+            $skip: ID!, $pools: [String!]!, $from: BigInt!, $to: BigInt!
+        ) {{
+            {snapshots} (
+                first: {PAGE_SIZE},
                 where: {{
-                    id_gt: "{skip_id}"
-                    {params.pool}: "{params.pool_id}"
-                    blockNumber_gte: {params.from_block}
-                    blockNumber_lte: {params.to_block}
+                    id_gt: $skip
+                    {pool}_in: $pools
+                    blockNumber_gte: $from
+                    blockNumber_lte: $to
                 }}
             ) {{
                 id
+                {pool} {{
+                    id
+                }}
                 blockNumber
                 timestamp
                 totalValueLockedUSD
                 cumulativeSupplySideRevenueUSD
+                {_token_weights_fields(pool, tokens, token_weights)}
             }}
         }}
         """
     )
 
 
+def query_apy_many(params: QueryAPYManyParams, skip_id=""):
+    document = _apy_many_document(
+        params.snapshots, params.pool, params.tokens, params.token_weights
+    )
+    return document, {
+        "skip": skip_id,
+        "pools": list(params.pool_ids),
+        "from": str(params.from_block),
+        "to": str(params.to_block),
+    }
+
+
 @dataclass
 class QueryTokenWeightsParams:
     pool: str
@@ -75,15 +175,21 @@ class QueryTokenWeightsParams:
     token_weights: str
 
 
-def query_token_weights(params: QueryTokenWeightsParams):
+@lru_cache(maxsize=None)
+def _token_weights_document(pool: str, token_weights: str):
     return gql(
         f"""
-        {{
-            {params.pool} (
-                id: "{params.pool_id}"
+        query TokenWeights($id: ID!) {{
+            {pool} (
+                id: $id
             ) {{
-                {params.token_weights}
+                {token_weights}
             }}
         }}
         """
     )
+
+
+def query_token_weights(params: QueryTokenWeightsParams):
+    document = _token_weights_document(params.pool, params.token_weights)
+    return document, {"id": params.pool_id}
@@ -0,0 +1,204 @@
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+__all__ = ["Pool", "PoolSnapshot", "SnapshotBatch", "Token"]
+
+# records are slotted, as there is one for every pool and token of a subgraph
+
+
+@dataclass
+class Token:
+    __slots__ = ("id", "name", "symbol")
+    id: str
+    name: str
+    symbol: str
+
+
+@dataclass
+class Pool:
+    __slots__ = ("id", "name", "tokens")
+    id: str
+    name: str
+    tokens: list[Token]
+
+
+@dataclass
+class PoolSnapshot:
+    __slots__ = (
+        "id",
+        "blockNumber",
+        "timestamp",
+        "totalValueLocked",
+        "cumulativeReward",
+        "tokenWeights",
+    )
+    id: str
+    blockNumber: int
+    timestamp: int
+    totalValueLocked: float
+    cumulativeReward: float
+    tokenWeights: Optional[dict[str, float]]
+
+
+def _objects(values) -> np.ndarray:
+    # object array of the values, without numpy unpacking sequences
+    out = np.empty(len(values), dtype=object)
+    out[:] = values
+    return out
+
+
+@dataclass
+class SnapshotBatch:
+    """Snapshots of many pools as columns, with one row per pool and block.
+
+    Rows of a pool are contiguous and ordered by block. Token weights are
+    flattened into columns of their own, indexed by the row they belong to.
+    The batch converts straight into the columnar rows written by
+    `database.bulk.upsert`, without creating an object per snapshot.
+    """
+
+    __slots__ = (
+        "pool_id",
+        "blockNumber",
+        "timestamp",
+        "totalValueLocked",
+        "cumulativeReward",
+        "weight_row",
+        "token_id",
+        "weight",
+    )
+    pool_id: np.ndarray
+    blockNumber: np.ndarray
+    timestamp: np.ndarray
+    totalValueLocked: np.ndarray
+    cumulativeReward: np.ndarray
+    weight_row: np.ndarray
+    token_id: np.ndarray
+    weight: np.ndarray
+
+    @classmethod
+    def empty(cls) -> "SnapshotBatch":
+        ints, floats = np.empty(0, dtype=np.int64), np.empty(0)
+        return cls(_objects([]), ints, ints, floats, floats, ints, _objects([]), floats)
+
+    @classmethod
+    def from_pool(cls, pool_id, columns, token_weights) -> "SnapshotBatch":
+        """Build the batch of a single pool.
+
+        `columns` are the arrays of `interpolate_snapshots`, and
+        `token_weights` the weights of each row, or None where missing.
+        """
+        num_rows = len(columns["blockNumber"])
+        weight_row, token_id, weight = [], [], []
+        for row, weights in enumerate(token_weights):
+            if weights is not None:
+                weight_row.extend([row] * len(weights))
+                token_id.extend(weights)
+                weight.extend(weights.values())
+        return cls(
+            _objects([pool_id] * num_rows),
+            columns["blockNumber"],
+            columns["timestamp"],
+            columns["totalValueLocked"],
+            columns["cumulativeReward"],
+            np.asarray(weight_row, dtype=np.int64),
+            _objects(token_id),
+            np.asarray(weight, dtype=float),
+        )
+
+    @classmethod
+    def concat(cls, batches) -> "SnapshotBatch":
+        batches = list(batches)
+        if len(batches) == 0:
+            return cls.empty()
+        # offset the rows of the token weights by the rows of the batches before
+        offsets = np.cumsum([0] + [len(batch) for batch in batches[:-1]])
+        return cls(
+            *(
+                np.concatenate([getattr(batch, name) for batch in batches])
+                for name in cls.__slots__[:5]
+            ),
+            np.concatenate(
+                [batch.weight_row + offset for batch, offset in zip(batches, offsets)]
+            ),
+            np.concatenate([batch.token_id for batch in batches]),
+            np.concatenate([batch.weight for batch in batches]),
+        )
+
+    def __len__(self) -> int:
+        return len(self.pool_id)
+
+    def take(self, mask) -> "SnapshotBatch":
+        # rows selected by a boolean mask, with their token weights
+        mask = np.asarray(mask, dtype=bool)
+        rows = np.cumsum(mask) - 1
+        weights = mask[self.weight_row]
+        return SnapshotBatch(
+            *(getattr(self, name)[mask] for name in self.__slots__[:5]),
+            rows[self.weight_row[weights]],
+            self.token_id[weights],
+            self.weight[weights],
+        )
+
+    def groups(self) -> dict[str, slice]:
+        # rows of each pool
+        if len(self) == 0:
+            return {}
+        starts = np.flatnonzero(self.pool_id[1:] != self.pool_id[:-1]) + 1
+        starts, ends = np.r_[0, starts], np.r_[starts, len(self)]
+        return {
+            self.pool_id[start]: slice(start, end)
+            for start, end in zip(starts.tolist(), ends.tolist())
+        }
+
+    def ids(self) -> np.ndarray:
+        return _objects(
+            [
+                pool_id + "_" + str(block)
+                for pool_id, block in zip(self.pool_id, self.blockNumber.tolist())
+            ]
+        )
+
+    def rows(self) -> dict[str, np.ndarray]:
+        """Return the columns of the `PoolSnapshot` table."""
+        return {
+            "id": self.ids(),
+            "blockNumber": self.blockNumber,
+            "timestamp": self.timestamp,
+            "totalValueLocked": self.totalValueLocked,
+            "cumulativeReward": self.cumulativeReward,
+            "pool_id": self.pool_id,
+        }
+
+    def weight_rows(self) -> dict[str, np.ndarray]:
+        """Return the columns of the `PoolTokenWeight` table."""
+        return {
+            "pool_id": self.pool_id[self.weight_row],
+            "token_id": self.token_id,
+            "blockNumber": self.blockNumber[self.weight_row],
+            "timestamp": self.timestamp[self.weight_row],
+            "weight": self.weight,
+        }
+
+    def snapshots(self) -> list[PoolSnapshot]:
+        # one record per row, with the token weights as dicts
+        token_weights = [None] * len(self)
+        for row, token_id, weight in zip(
+            self.weight_row.tolist(), self.token_id, self.weight.tolist()
+        ):
+            if token_weights[row] is None:
+                token_weights[row] = {}
+            token_weights[row][token_id] = weight
+        return [
+            PoolSnapshot(*row)
+            for row in zip(
+                self.ids().tolist(),
+                self.blockNumber.tolist(),
+                self.timestamp.tolist(),
+                self.totalValueLocked.tolist(),
+                self.cumulativeReward.tolist(),
+                token_weights,
+            )
+        ]
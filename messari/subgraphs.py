@@ -1,47 +1,88 @@
 import logging
-from dataclasses import dataclass
+import os
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Iterator, Optional
 
-import pandas as pd
+import numpy as np
+from aiohttp import ClientError
 from gql import Client
+from gql.client import SyncClientSession
+from gql.transport.aiohttp import AIOHTTPTransport
 from gql.transport.exceptions import TransportQueryError, TransportServerError
 from gql.transport.requests import RequestsHTTPTransport
 from gql.transport.requests import log as requests_logger
 from graphql.error.graphql_error import GraphQLError
 
+from messari.cache import SCHEMA_TTL, load_introspection, save_introspection, stats
+from messari.fetch import paginate
 from messari.queries import (
+    PAGE_SIZE,
+    QueryAPYManyParams,
     QueryAPYParams,
     QueryPoolsParams,
     QueryTokenWeightsParams,
     query_apy,
+    query_apy_many,
     query_pools,
     query_token_weights,
 )
+from messari.records import Pool, PoolSnapshot, SnapshotBatch, Token
 
 requests_logger.setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
 
+BASE_URL = os.environ.get(
+    "SUBGRAPH_BASE_URL", "https://api.thegraph.com/subgraphs/name/messari/"
+)
 
-@dataclass
-class Token:
-    id: str
-    name: str
-    symbol: str
 
+def interpolate_snapshots(data, blocks) -> dict[str, np.ndarray]:
+    """Linearly interpolate raw subgraph snapshots at the target blocks.
 
-@dataclass
-class Pool:
-    id: str
-    name: str
-    tokens: list[Token]
+    Only the target blocks are evaluated. Values before the first or after the
+    last snapshot are held constant, and the last snapshot wins when several
+    share a block number. Returns a dict of columnar arrays.
+    """
+    blocks = np.asarray(blocks, dtype=np.int64)
+    xp = np.fromiter((int(s["blockNumber"]) for s in data), np.int64, len(data))
+    values = np.array(
+        [
+            (
+                float(s["timestamp"]),
+                float(s["totalValueLockedUSD"]),
+                float(s["cumulativeSupplySideRevenueUSD"]),
+            )
+            for s in data
+        ],
+        dtype=np.float64,
+    ).reshape(-1, 3)
 
+    # sort by block number and keep the last of duplicated blocks
+    order = np.argsort(xp, kind="stable")
+    xp, values = xp[order], values[order]
+    keep = np.append(xp[1:] != xp[:-1], True)
+    xp, values = xp[keep], values[keep]
 
-@dataclass
-class PoolSnapshot:
-    id: str
-    blockNumber: int
-    timestamp: int
-    totalValueLocked: float
-    cumulativeReward: float
+    return {
+        "blockNumber": blocks,
+        "timestamp": np.rint(np.interp(blocks, xp, values[:, 0])).astype(np.int64),
+        "totalValueLocked": np.interp(blocks, xp, values[:, 1]),
+        "cumulativeReward": np.interp(blocks, xp, values[:, 2]),
+    }
+
+
+def nearest_snapshots(data, blocks) -> np.ndarray:
+    """Return the index of the last raw snapshot at or before each target block.
+
+    Blocks before the first snapshot map to the first one, and the last
+    snapshot wins when several share a block number.
+    """
+    xp = np.fromiter((int(s["blockNumber"]) for s in data), np.int64, len(data))
+    order = np.argsort(xp, kind="stable")
+    idx = np.searchsorted(xp[order], np.asarray(blocks, dtype=np.int64), "right")
+    return order[np.clip(idx - 1, 0, len(xp) - 1)]
 
 
 @dataclass
@@ -50,27 +91,83 @@ class Subgraph:
     schema_type: str
     endpoint: str
 
-    def __init_client(self):
-        # initialize gql client
-        url = "https://api.thegraph.com/subgraphs/name/messari/" + self.endpoint
-        transport = RequestsHTTPTransport(url=url)
-        self.client = Client(transport=transport, fetch_schema_from_transport=True)
+    _session: Optional[SyncClientSession] = field(
+        default=None, init=False, repr=False, compare=False
+    )
+    _connected_at: float = field(default=0.0, init=False, repr=False, compare=False)
 
     @property
-    def pools(self) -> list[Pool]:
+    def url(self) -> str:
+        return BASE_URL + self.endpoint
+
+    def __client(self) -> Client:
+        # use the schema cached on disk to skip the introspection query
+        introspection = load_introspection(self.endpoint)
+        transport = RequestsHTTPTransport(url=self.url)
+        return Client(
+            transport=transport,
+            introspection=introspection,
+            fetch_schema_from_transport=introspection is None,
+        )
+
+    def __connect(self) -> SyncClientSession:
+        # keep a single session per endpoint so that the schema is only loaded
+        # once and the http connection is kept alive across requests
+        if self._session is not None:
+            if time.time() - self._connected_at < SCHEMA_TTL:
+                return self._session
+            self.close()
+
+        client = self.__client()
+        self._session = client.connect_sync()
+        self._connected_at = time.time()
+        stats["connections"] += 1
+        if client.fetch_schema_from_transport:
+            save_introspection(self.endpoint, client.introspection)
+        return self._session
+
+    def close(self):
+        if self._session is not None:
+            self._session.client.close_sync()
+            self._session = None
+
+    def _execute(self, query):
+        # a parsed document and its variables
+        document, variables = query
+        session = self.__connect()
+        stats["requests"] += 1
+        return session.execute(document, variable_values=variables)
+
+    @asynccontextmanager
+    async def session(self):
+        # open an async gql session for concurrent requests
+        introspection = load_introspection(self.endpoint)
+        transport = AIOHTTPTransport(url=self.url)
+        client = Client(
+            transport=transport,
+            introspection=introspection,
+            fetch_schema_from_transport=introspection is None,
+        )
+        async with client as session:
+            stats["connections"] += 1
+            if introspection is None:
+                save_introspection(self.endpoint, client.introspection)
+            yield session
+
+    def _pools_params(self) -> QueryPoolsParams:
         # create query mappings according to the schema type
         if self.schema_type == "DEX AMM":
-            params = QueryPoolsParams(
+            return QueryPoolsParams(
                 "liquidityPools",
                 "inputTokens",
             )
         elif self.schema_type in ["Lending Protocol", "CDP"]:
-            params = QueryPoolsParams(
+            return QueryPoolsParams(
                 "markets",
                 "inputToken",
             )
         elif self.schema_type == "Yield Aggregator":
-            params = QueryPoolsParams(
+            return QueryPoolsParams(
                 "vaults",
                 "inputToken",
             )
@@ -78,48 +175,20 @@ class Subgraph:
             logger.error(f"Query for schema type {self.schema_type} is not implemented")
             raise NotImplementedError
 
-        # fetch all pools from subgraph
-        skip_id = ""
-        data = []
-        self.__init_client()
-        while True:
-            try:
-                response = self.client.execute(query_pools(params, skip_id))
-            except (TransportQueryError, TransportServerError, GraphQLError) as e:
-                logger.error(e)
-                return []
-
-            key = list(response.keys())[0]
-            result = response[key]
-            if len(result) == 0:
-                break
-            for pool in result:
-                tokens = pool[params.tokens]
-                if not isinstance(tokens, list):
-                    tokens = [tokens]
-                tokens = [Token(**token) for token in tokens]
-                data.append(
-                    Pool(
-                        id=pool["id"],
-                        name=pool["name"],
-                        tokens=tokens,
-                    )
-                )
-            skip_id = result[-1]["id"]
-        return data
-
-    def snapshots(self, pool_id, blocks) -> list[PoolSnapshot]:
+    def _snapshots_params(self, pool_id, blocks) -> QueryAPYParams:
         # create query mappings according to the schema type
         if self.schema_type == "DEX AMM":
-            params = QueryAPYParams(
+            return QueryAPYParams(
                 "liquidityPoolDailySnapshots",
                 "pool",
                 pool_id,
                 blocks[0],
                 blocks[-1],
+                "inputTokens",
+                "inputTokenWeights",
             )
         elif self.schema_type in ["Lending Protocol", "CDP"]:
-            params = QueryAPYParams(
+            return QueryAPYParams(
                 "marketDailySnapshots",
                 "market",
                 pool_id,
@@ -127,7 +196,7 @@ class Subgraph:
                 blocks[-1],
             )
         elif self.schema_type == "Yield Aggregator":
-            params = QueryAPYParams(
+            return QueryAPYParams(
                 "vaultDailySnapshots",
                 "vault",
                 pool_id,
@@ -138,51 +207,221 @@ class Subgraph:
             logger.error(f"Query for schema type {self.schema_type} is not implemented")
             raise NotImplementedError
 
+    def _snapshots_many_params(self, pool_ids, blocks) -> QueryAPYManyParams:
+        params = self._snapshots_params(None, blocks)
+        return QueryAPYManyParams(
+            params.snapshots,
+            params.pool,
+            pool_ids,
+            params.from_block,
+            params.to_block,
+            params.tokens,
+            params.token_weights,
+        )
+
+    @staticmethod
+    def _parse_pools(result, params) -> list[Pool]:
+        data = []
+        for pool in result:
+            tokens = pool[params.tokens]
+            if not isinstance(tokens, list):
+                tokens = [tokens]
+            tokens = [Token(**token) for token in tokens]
+            data.append(
+                Pool(
+                    id=pool["id"],
+                    name=pool["name"],
+                    tokens=tokens,
+                )
+            )
+        return data
+
+    @staticmethod
+    def _parse_token_weights(snapshot, params) -> Optional[dict[str, float]]:
+        tokens = [token["id"] for token in snapshot[params.pool][params.tokens]]
+        weights = [float(weight) for weight in snapshot[params.token_weights]]
+        if len(tokens) != len(weights):
+            return None
+        return dict(zip(tokens, weights))
+
+    @classmethod
+    def _interpolate(cls, pool_id, data, params, blocks) -> SnapshotBatch:
+        if len(data) == 0:
+            return SnapshotBatch.empty()
+
+        out = interpolate_snapshots(data, blocks)
+        # token weights are taken from the latest snapshot as they are, parsed
+        # once for all the blocks sharing it
+        weights = [None] * len(blocks)
+        if params.token_weights != "":
+            nearest = nearest_snapshots(data, blocks).tolist()
+            parsed = {
+                idx: cls._parse_token_weights(data[idx], params) for idx in set(nearest)
+            }
+            weights = [parsed[idx] for idx in nearest]
+        return SnapshotBatch.from_pool(pool_id, out, weights)
+
+    def _split(self, pool_ids, data, params, blocks) -> SnapshotBatch:
+        # group snapshots of a batched query by pool before interpolating
+        grouped = {pool_id: [] for pool_id in pool_ids}
+        for snapshot in data:
+            grouped[snapshot[params.pool]["id"]].append(snapshot)
+        return SnapshotBatch.concat(
+            self._interpolate(pool_id, data, params, blocks)
+            for pool_id, data in grouped.items()
+        )
+
+    def iter_pools(self) -> Iterator[list[Pool]]:
+        """Yield the pools of the subgraph one page at a time.
+
+        Stops after logging the error if a page fails, so the pages yielded
+        before are kept.
+        """
+        params = self._pools_params()
+
+        skip_id = ""
+        while True:
+            try:
+                response = self._execute(query_pools(params, skip_id))
+            except (TransportQueryError, TransportServerError, GraphQLError) as e:
+                logger.error(e)
+                return
+
+            key = list(response.keys())[0]
+            result = response[key]
+            if len(result) > 0:
+                yield self._parse_pools(result, params)
+            if len(result) < PAGE_SIZE:
+                return
+            skip_id = result[-1]["id"]
+
+    @property
+    def pools(self) -> list[Pool]:
+        # fetch all pools from subgraph
+        return [pool for page in self.iter_pools() for pool in page]
+
+    async def aiter_pools(self, session, limiter) -> AsyncIterator[list[Pool]]:
+        """Yield the pools of the subgraph one page at a time, concurrently.
+
+        The next page is requested while the caller processes the current
+        one. Stops after logging the error if a page fails.
+        """
+        params = self._pools_params()
+
+        try:
+            async for result in paginate(
+                session, query_pools, params, limiter, self.endpoint
+            ):
+                yield self._parse_pools(result, params)
+        except (
+            TransportQueryError,
+            TransportServerError,
+            GraphQLError,
+            ClientError,
+        ) as e:
+            logger.error(e)
+
+    async def fetch_pools(self, session, limiter) -> list[Pool]:
+        # fetch all pools from subgraph, parsing while the next page is in flight
+        return [
+            pool async for page in self.aiter_pools(session, limiter) for pool in page
+        ]
+
+    def snapshots(self, pool_id, blocks) -> list[PoolSnapshot]:
+        params = self._snapshots_params(pool_id, blocks)
+
         # fetch subgraph data
         skip_id = ""
         data = []
-        self.__init_client()
         while True:
             try:
-                response = self.client.execute(query_apy(params, skip_id))
+                response = self._execute(query_apy(params, skip_id))
             except (TransportQueryError, TransportServerError, GraphQLError) as e:
                 logger.error(e)
                 return []
 
             key = list(response.keys())[0]
             result = response[key]
-            if len(result) == 0:
-                break
             data.extend(result)
+            if len(result) < PAGE_SIZE:
+                break
             skip_id = result[-1]["id"]
 
-        if len(data) == 0:
+        return self._interpolate(pool_id, data, params, blocks).snapshots()
+
+    async def fetch_snapshots(
+        self, session, limiter, pool_id, blocks
+    ) -> list[PoolSnapshot]:
+        params = self._snapshots_params(pool_id, blocks)
+
+        # fetch subgraph data
+        data = []
+        try:
+            async for result in paginate(
+                session, query_apy, params, limiter, self.endpoint
+            ):
+                data.extend(result)
+        except (
+            TransportQueryError,
+            TransportServerError,
+            GraphQLError,
+            ClientError,
+        ) as e:
+            logger.error(e)
             return []
 
-        # interpolate missing data
-        out = pd.DataFrame(
-            None,
-            index=range(blocks[0], blocks[-1] + 1),
-            columns=["timestamp", "totalValueLocked", "cumulativeReward"],
-        )
-        for snapshot in data:
-            out.loc[int(snapshot["blockNumber"])] = [
-                int(snapshot["timestamp"]),
-                float(snapshot["totalValueLockedUSD"]),
-                float(snapshot["cumulativeSupplySideRevenueUSD"]),
-            ]
-        # linear interpolation
-        out = out.apply(pd.to_numeric).interpolate(limit_direction="both")
-        return [
-            PoolSnapshot(
-                id=pool_id + "_" + str(idx),
-                blockNumber=idx,
-                timestamp=snapshot.timestamp,
-                totalValueLocked=snapshot.totalValueLocked,
-                cumulativeReward=snapshot.cumulativeReward,
-            )
-            for idx, snapshot in out.loc[blocks].iterrows()
-        ]
+        return self._interpolate(pool_id, data, params, blocks).snapshots()
+
+    def snapshots_many(self, pool_ids, blocks, batch_size=50) -> SnapshotBatch:
+        out = []
+        for idx in range(0, len(pool_ids), batch_size):
+            batch = list(pool_ids[idx : idx + batch_size])
+            params = self._snapshots_many_params(batch, blocks)
+
+            # fetch subgraph data for the whole batch of pools
+            skip_id = ""
+            data = []
+            while True:
+                try:
+                    response = self._execute(query_apy_many(params, skip_id))
+                except (TransportQueryError, TransportServerError, GraphQLError) as e:
+                    logger.error(e)
+                    data = None
+                    break
+
+                key = list(response.keys())[0]
+                result = response[key]
+                data.extend(result)
+                if len(result) < PAGE_SIZE:
+                    break
+                skip_id = result[-1]["id"]
+
+            if data is not None:
+                out.append(self._split(batch, data, params, blocks))
+        return SnapshotBatch.concat(out)
+
+    async def fetch_snapshots_many(
+        self, session, limiter, pool_ids, blocks
+    ) -> SnapshotBatch:
+        params = self._snapshots_many_params(list(pool_ids), blocks)
+
+        # fetch subgraph data for the whole batch of pools
+        data = []
+        try:
+            async for result in paginate(
+                session, query_apy_many, params, limiter, self.endpoint
+            ):
+                data.extend(result)
+        except (
+            TransportQueryError,
+            TransportServerError,
+            GraphQLError,
+            ClientError,
+        ) as e:
+            logger.error(e)
+            return SnapshotBatch.empty()
+
+        return self._split(params.pool_ids, data, params, blocks)
 
     def token_weights(self, pool_id) -> list[float]:
         # create query mappings according to the schema type
@@ -195,9 +434,8 @@ class Subgraph:
             raise NotImplementedError
 
         # fetch subgraph data
-        self.__init_client()
         try:
-            response = self.client.execute(query_token_weights(params))
+            response = self._execute(query_token_weights(params))
         except (TransportQueryError, TransportServerError, GraphQLError) as e:
             logger.error(e)
             return []
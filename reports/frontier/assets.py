@@ -1,12 +1,14 @@
 import altair as alt
 import numpy as np
 import pandas as pd
+from backtest import HISTORY_DAYS, STRATEGIES, walk_forward
 from preprocess import (
     daily_returns,
     efficient_frontier,
     min_volatility_portfolio,
     pool_stats,
     risk_parity_portfolio,
+    solve_portfolios,
     tangency_portfolio,
 )
 
@@ -16,18 +18,30 @@ __all__ = [
     "tangency_data",
     "min_volatility_data",
     "risk_parity_data",
+    "backtest_data",
 ]
 
 
 # preprocess data
-pools, hodl, apy = daily_returns()
+pools, hodl, apy = daily_returns(days=HISTORY_DAYS)
+backtest_pools, backtest_returns = pools, hodl + apy
 returns = (hodl + apy).iloc[-90:]  # last 90 days
 pools, mu, cov = pool_stats(pools, returns)
 sigma = np.sqrt(np.diag(cov))
 
+# solve the portfolios in parallel
+portfolios = solve_portfolios(
+    {
+        "frontier": (efficient_frontier, mu, cov),
+        "tangency": (tangency_portfolio, mu, cov),
+        "min_volatility": (min_volatility_portfolio, mu, cov),
+        "risk_parity": (risk_parity_portfolio, mu, cov),
+    }
+)
+
 
 # efficient frontier
-xs, ys, nonzero = efficient_frontier(mu, cov)
+xs, ys, nonzero = portfolios["frontier"]
 data = pd.DataFrame(
     np.stack([mu, sigma]).T, columns=["Return", "Volatility"], index=mu.index
 )
@@ -107,7 +121,7 @@ uniform_text = uniform_point.mark_text(
 
 
 # tangency portfolio
-portfolio_return, portfolio_std, portfolio_weights = tangency_portfolio(mu, cov)
+portfolio_return, portfolio_std, portfolio_weights = portfolios["tangency"]
 portfolio_weights = pd.Series(portfolio_weights, index=mu.index, name="Weight")
 tangency_data = pd.concat(
     [
@@ -152,7 +166,7 @@ tangency_text = tangency_point.mark_text(
 
 
 # min volatility portfolio
-portfolio_return, portfolio_std, portfolio_weights = min_volatility_portfolio(mu, cov)
+portfolio_return, portfolio_std, portfolio_weights = portfolios["min_volatility"]
 portfolio_weights = pd.Series(portfolio_weights, index=mu.index, name="Weight")
 min_volatility_data = pd.concat(
     [
@@ -197,7 +211,7 @@ min_volatility_text = min_volatility_point.mark_text(
 
 
 # risk parity portfolio
-portfolio_return, portfolio_std, portfolio_weights = risk_parity_portfolio(mu, cov)
+portfolio_return, portfolio_std, portfolio_weights = portfolios["risk_parity"]
 portfolio_weights = pd.Series(portfolio_weights, index=mu.index, name="Weight")
 risk_parity_data = pd.concat(
     [
@@ -263,29 +277,22 @@ chart_frontier = (
 )
 
 
-# backtest results
-start, end = -120, -30
-pools, hodl, apy = daily_returns()
-_, mu, cov = pool_stats(pools, (hodl + apy).iloc[start:end])  # 90 days window
-_, _, _tangency_weights = tangency_portfolio(mu, cov)
-_, _, _min_volatility_weights = min_volatility_portfolio(mu, cov)
-_, _, _risk_parity_weights = risk_parity_portfolio(mu, cov)
+# backtest results, over rolling 90 days windows tested on the next 30 days
+backtest = walk_forward(backtest_pools, backtest_returns)
+latest = backtest.iloc[-1]  # tested on the last 30 days
+uniform_return, uniform_mdd = latest["uniform", "return"], latest["uniform", "mdd"]
+tangency_return, tangency_mdd = latest["tangency", "return"], latest["tangency", "mdd"]
+min_volatility_return = latest["min_volatility", "return"]
+min_volatility_mdd = latest["min_volatility", "mdd"]
+risk_parity_return = latest["risk_parity", "return"]
+risk_parity_mdd = latest["risk_parity", "mdd"]
 
-returns = (hodl + apy).iloc[end:][mu.index]  # previous 30 days
-_uniform_return = (1 + returns.mean(axis=1)).cumprod()
-uniform_return = _uniform_return[-1] - 1
-uniform_mdd = (_uniform_return / _uniform_return.cummax() - 1).min()
-
-_tangency_return = (1 + (returns * _tangency_weights).sum(axis=1)).cumprod()
-tangency_return = _tangency_return[-1] - 1
-tangency_mdd = (_tangency_return / _tangency_return.cummax() - 1).min()
-
-_min_volatility_return = (1 + (returns * _min_volatility_weights).sum(axis=1)).cumprod()
-min_volatility_return = _min_volatility_return[-1] - 1
-min_volatility_mdd = (
-    _min_volatility_return / _min_volatility_return.cummax() - 1
-).min()
-
-_risk_parity_return = (1 + (returns * _risk_parity_weights).sum(axis=1)).cumprod()
-risk_parity_return = _risk_parity_return[-1] - 1
-risk_parity_mdd = (_risk_parity_return / _risk_parity_return.cummax() - 1).min()
+backtest_data = backtest.mean().unstack().reindex(STRATEGIES)
+backtest_data.index = [
+    "Uniform Portfolio",
+    "Tangency Portfolio",
+    "Min Volatility Portfolio",
+    "Risk Parity Portfolio",
+]
+backtest_data.columns = ["Mean Return", "Mean Max Drawdown", "Mean Turnover"]
+backtest_data.index.name = f"{len(backtest)} Windows"
@@ -0,0 +1,130 @@
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+from preprocess import (
+    min_volatility_portfolio,
+    pool_stats,
+    risk_parity_portfolio,
+    tangency_portfolio,
+)
+
+__all__ = ["STRATEGIES", "walk_forward"]
+
+logger = logging.getLogger(__name__)
+
+STRATEGIES = ["uniform", "tangency", "min_volatility", "risk_parity"]
+METRICS = ["return", "mdd", "turnover"]
+TRAIN_DAYS = 90
+TEST_DAYS = 30
+MIN_TRAIN_DAYS = 30  # shortest training window of a shorter history
+STEP_DAYS = int(os.environ.get("BACKTEST_STEP", 7))
+HISTORY_DAYS = int(os.environ.get("BACKTEST_DAYS", 210))
+
+
+def _warm_start(previous, columns):
+    # previous weights of the pools still held, if any
+    if previous is None:
+        return None
+    x0 = previous[columns]
+    if x0.sum() <= 0:
+        return None
+    return x0 / x0.sum()
+
+
+def window_weights(pools, returns, starts, train=TRAIN_DAYS, warm_start=True):
+    """Return the weights of every strategy, trained before each start day.
+
+    Weights are indexed by strategy, window and pool, and are zero for the
+    pools removed as outliers in a window, and for the pools without data
+    over its training days, whose filled in returns are flat. With `warm_start`, the optimizers
+    start from the weights of the previous window.
+    """
+    # pools by position, as pool names need not be unique
+    pools = pools.set_axis(range(len(pools)))
+    values = returns.set_axis(range(returns.shape[1]), axis=1)
+    weights = np.zeros((len(STRATEGIES), len(starts), returns.shape[1]))
+    # first day of real returns of each pool, the day after its first data
+    first = pd.to_datetime([pool["start"] for pool in pools], unit="s")
+    previous = {}
+    for window, start in enumerate(starts):
+        real = np.asarray(first < returns.index[start - train])
+        _, mu, cov = pool_stats(
+            pools[real], values.iloc[start - train : start].loc[:, real]
+        )
+        columns = mu.index.to_numpy()
+        solutions = {
+            "uniform": np.full(len(columns), 1 / len(columns)),
+            "tangency": tangency_portfolio(
+                mu, cov, _warm_start(previous.get("tangency"), columns)
+            )[2],
+            "min_volatility": min_volatility_portfolio(
+                mu, cov, _warm_start(previous.get("min_volatility"), columns)
+            )[2],
+            "risk_parity": risk_parity_portfolio(mu, cov)[2],
+        }
+        for idx, strategy in enumerate(STRATEGIES):
+            weights[idx, window, columns] = solutions[strategy]
+            if warm_start:
+                previous[strategy] = weights[idx, window]
+        logger.debug(f"Trained window {window + 1} of {len(starts)}")
+    return weights
+
+
+def evaluate(returns, weights, starts, test=TEST_DAYS):
+    """Return, maximum drawdown and turnover of the weights in each window.
+
+    Holds the weights of each window over the `test` days from its start,
+    evaluating all strategies and windows at once. Turnover is half the
+    absolute change from the weights of the previous window, and missing for
+    the first window.
+    """
+    values = np.asarray(returns, dtype=float)
+    # returns of every test window as a (window, pool, day) view
+    windows = np.lib.stride_tricks.sliding_window_view(values, test, axis=0)
+    portfolio = np.einsum("wnt,swn->swt", windows[starts], weights)
+
+    growth = np.cumprod(1 + portfolio, axis=-1)
+    total = growth[..., -1] - 1
+    mdd = (growth / np.maximum.accumulate(growth, axis=-1) - 1).min(axis=-1)
+    changes = np.diff(weights, axis=1, prepend=np.nan)
+    turnover = 0.5 * np.abs(changes).sum(axis=-1)
+    return np.stack([total, mdd, turnover], axis=-1)
+
+
+def walk_forward(
+    pools,
+    returns,
+    train=TRAIN_DAYS,
+    test=TEST_DAYS,
+    step=STEP_DAYS,
+    warm_start=True,
+):
+    """Backtest the strategies over rolling windows of daily returns.
+
+    Each window trains on `train` days and holds the portfolios for the next
+    `test` days. Windows move by `step` days, and the last one tests the
+    latest `test` days. Histories too short for a full window fall back to a
+    single window trained on all days before the latest `test` days. Returns
+    the metrics by test start date, with columns by strategy and metric.
+    """
+    last = len(returns) - test
+    starts = np.arange(last, train - 1, -step)[::-1]
+    if len(starts) == 0:
+        if last < MIN_TRAIN_DAYS:
+            raise ValueError(f"Need at least {MIN_TRAIN_DAYS + test} days of returns")
+        logger.warning(
+            f"Only {len(returns)} days of returns, backtesting a single window "
+            f"trained on {last} days"
+        )
+        train, starts = last, np.array([last])
+
+    weights = window_weights(pools, returns, starts, train, warm_start)
+    metrics = evaluate(returns, weights, starts, test)
+    results = pd.DataFrame(
+        metrics.transpose(1, 0, 2).reshape(len(starts), -1),
+        index=returns.index[starts],
+        columns=pd.MultiIndex.from_product([STRATEGIES, METRICS]),
+    )
+    return results
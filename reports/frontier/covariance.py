@@ -0,0 +1,166 @@
+import hashlib
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+__all__ = [
+    "COVARIANCE_ESTIMATOR",
+    "ESTIMATORS",
+    "cholesky_factor",
+    "estimate_covariance",
+    "factor_model",
+    "ledoit_wolf",
+    "oas",
+    "sample_covariance",
+]
+
+logger = logging.getLogger(__name__)
+
+COVARIANCE_ESTIMATOR = os.environ.get("COVARIANCE_ESTIMATOR", "ledoit_wolf")
+NUM_FACTORS = int(os.environ.get("COVARIANCE_FACTORS", 5))
+FACTOR_CACHE_SIZE = 8
+
+# cholesky factors by content hash of the covariance
+_factors = {}
+
+
+def _standardize(returns):
+    # centered returns scaled to unit variance, zero for constant columns
+    values = np.asarray(returns, dtype=float)
+    values = values - np.nanmean(values, axis=0)
+    values = np.nan_to_num(values)
+    std = np.sqrt((values**2).mean(axis=0))
+    scale = np.divide(1.0, std, out=np.zeros_like(std), where=std > 0)
+    return values * scale
+
+
+def _shrink(corr, shrinkage):
+    # convex combination with the scaled identity
+    target = np.trace(corr) / len(corr)
+    return (1 - shrinkage) * corr + shrinkage * target * np.eye(len(corr))
+
+
+def _ledoit_wolf(x):
+    n, p = x.shape
+    corr = x.T @ x / n
+    target = np.trace(corr) / p
+    x2 = x**2
+    beta = ((x2.T @ x2).sum() / n - (corr**2).sum()) / (p * n)
+    delta = ((corr**2).sum() - 2 * target * np.trace(corr) + p * target**2) / p
+    beta = min(beta, delta)
+    shrinkage = 0.0 if beta == 0 else beta / delta
+    logger.debug(f"Ledoit-Wolf shrinkage {shrinkage:.4f}")
+    return _shrink(corr, shrinkage)
+
+
+def _oas(x):
+    n, p = x.shape
+    corr = x.T @ x / n
+    target = np.trace(corr) / p
+    alpha = (corr**2).mean()
+    num = alpha + target**2
+    den = (n + 1) * (alpha - target**2 / p)
+    shrinkage = 1.0 if den == 0 else min(num / den, 1.0)
+    logger.debug(f"OAS shrinkage {shrinkage:.4f}")
+    return _shrink(corr, shrinkage)
+
+
+def _factor(x, num_factors):
+    # leading principal components, with the rest as specific variance
+    n, p = x.shape
+    _, s, vt = np.linalg.svd(x / np.sqrt(n), full_matrices=False)
+    loadings = vt[:num_factors].T * s[:num_factors]
+    corr = loadings @ loadings.T
+    variances = (x**2).mean(axis=0)
+    specific = np.maximum(variances - np.diag(corr), 1e-6 * variances)
+    corr[np.diag_indices(p)] += specific
+    return corr
+
+
+def _from_correlation(returns, estimate, *args):
+    # rescale the estimated correlation by the sample volatilities
+    corr = estimate(_standardize(returns), *args)
+    std = returns.std().to_numpy(dtype=float)
+    return pd.DataFrame(
+        corr * np.outer(std, std), index=returns.columns, columns=returns.columns
+    )
+
+
+def sample_covariance(returns):
+    return returns.cov()
+
+
+def ledoit_wolf(returns):
+    """Shrink the sample correlations towards zero.
+
+    The shrinkage intensity minimizes the expected Frobenius loss, following
+    Ledoit and Wolf (2004).
+    """
+    return _from_correlation(returns, _ledoit_wolf)
+
+
+def oas(returns):
+    """Shrink the sample correlations towards zero.
+
+    The shrinkage intensity is the oracle approximating estimate of Chen et
+    al. (2010), which improves on Ledoit-Wolf for few observations.
+    """
+    return _from_correlation(returns, _oas)
+
+
+def factor_model(returns, num_factors=NUM_FACTORS):
+    """Explain the correlations with the leading principal components."""
+    return _from_correlation(returns, _factor, num_factors)
+
+
+ESTIMATORS = {
+    "sample": sample_covariance,
+    "ledoit_wolf": ledoit_wolf,
+    "oas": oas,
+    "factor": factor_model,
+}
+
+
+def estimate_covariance(returns, estimator=COVARIANCE_ESTIMATOR):
+    """Estimate the covariance of returns, by estimator name.
+
+    The shrinkage and factor estimators keep the sample variances and only
+    regularize the correlations, so the result is well-conditioned even with
+    more pools than observations.
+    """
+    if estimator not in ESTIMATORS:
+        raise ValueError(f"Unknown covariance estimator: {estimator}")
+    return ESTIMATORS[estimator](returns)
+
+
+def cholesky_factor(cov):
+    """Return the upper triangular factor `U` with `U.T @ U == cov`.
+
+    Factors are cached by the content of the covariance. Singular
+    covariances get the smallest diagonal jitter that makes them positive
+    definite.
+    """
+    values = np.ascontiguousarray(cov, dtype=float)
+    if not np.isfinite(values).all():
+        raise ValueError("Covariance has missing or infinite values")
+    key = hashlib.sha256(values.tobytes()).hexdigest() + str(values.shape)
+    if key in _factors:
+        return _factors[key]
+
+    scale = max(np.trace(values) / max(len(values), 1), np.finfo(float).tiny)
+    jitter = 0.0
+    while True:
+        try:
+            factor = np.linalg.cholesky(values + jitter * np.eye(len(values))).T
+            break
+        except np.linalg.LinAlgError:
+            jitter = max(10 * jitter, 1e-12 * scale)
+            logger.debug(f"Covariance is not positive definite, jitter {jitter}")
+
+    # keep only the latest factors
+    if len(_factors) >= FACTOR_CACHE_SIZE:
+        _factors.pop(next(iter(_factors)))
+    _factors[key] = factor
+    return factor
@@ -2,6 +2,7 @@ import os
 
 import datapane as dp
 from assets import (
+    backtest_data,
     chart_frontier,
     frontier_data,
     min_volatility_data,
@@ -104,6 +105,8 @@ Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor i
         ),
         columns=4,
     ),
+    dp.Text("#### Rolling Windows"),
+    dp.Table(backtest_data),
     dp.Text(
         """
 Description of the backtesting method and the exemplary portfolios
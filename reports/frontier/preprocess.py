@@ -1,130 +1,146 @@
+import hashlib
+import json
+import logging
 import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
 
 import numpy as np
 import pandas as pd
 from scipy.optimize import minimize
-from sqlmodel import Session, select
 
 sys.path.insert(1, os.path.join(sys.path[0], "..", ".."))
 
-from database.engine import engine
-from database.models import Pool, PoolSnapshot, TokenSnapshot
-from messari.subgraphs import subgraphs
-
-
-def load_pool_data():
-    with Session(engine) as session:
-        # load pool data from database
-        statement = select(PoolSnapshot.pool_id).where(PoolSnapshot.pool_id != None)
-        pool_ids = set(session.exec(statement).all())
-        pools = [session.get(Pool, pool_id) for pool_id in pool_ids]
-
-        # load token data for each pool
-        pool_info, pool_data = [], []
-        for pool in pools:
-            # pool token prices
-            subgraph = [s for s in subgraphs if s.protocol == pool.protocol][0]
-            prices = []
-            for token in pool.tokens:
-                statement = select(TokenSnapshot).where(
-                    TokenSnapshot.token_id == token.id
-                )
-                token_snapshots = session.exec(statement).all()
-                prices.append(
-                    pd.Series(
-                        [snapshot.price for snapshot in token_snapshots],
-                        index=[snapshot.timestamp for snapshot in token_snapshots],
-                        dtype=float,
-                    )
-                )
-            prices = pd.DataFrame(prices).T.sort_index()
-            if len(prices) == 0:
-                continue
-
-            # apply token weights if the pool has multiple tokens
-            if len(prices.columns) > 1:
-                try:
-                    token_weights = np.asarray(
-                        subgraph.token_weights(pool.id), dtype=float
-                    )
-                except Exception as e:
-                    token_weights = np.ones(len(pool.tokens))
-                if len(token_weights) != len(pool.tokens):
-                    token_weights = np.ones(len(pool.tokens))
-                token_weights /= token_weights.sum()
-                prices = prices @ token_weights
-            else:
-                prices = prices[0]
-            prices.name = pool.name
-
-            # pool tvl and rewards
-            statement = select(
-                PoolSnapshot.timestamp,
-                PoolSnapshot.totalValueLocked,
-                PoolSnapshot.cumulativeReward,
-            ).where(PoolSnapshot.pool_id == pool.id)
-            values = session.exec(statement).all()
-            index, tvls, rewards = list(zip(*values))
-            if len(index) == 0:
-                continue
-
-            tvls = pd.Series(tvls, index=index, dtype=float).sort_index()
-            tvls = tvls[~tvls.index.duplicated(keep="first")]
-            tvls.name = pool.name
-            rewards = pd.Series(rewards, index=index, dtype=float).sort_index()
-            rewards = rewards[~rewards.index.duplicated(keep="first")]
-            rewards.name = pool.name
-
-            pool_info.append(pool.__dict__)
-            pool_data.extend([prices, tvls, rewards])
-
-    return pool_info, pool_data
-
-
-def daily_returns():
-    # load pool data
-    pool_info, pool_data = load_pool_data()
-
-    # resample daily data for the last 120 days
-    pool_data = pd.DataFrame(pool_data).T
-    pool_data.index = pd.to_datetime(pool_data.index, unit="s")
-    pool_data = pool_data.resample("1D").last().iloc[-120:]
-
-    pools, hodl, apy = [], [], []
-    for idx in range(0, len(pool_info)):
-        _pool_data = pool_data.iloc[:, 3 * idx : 3 * idx + 3]
-        if _pool_data.iloc[-1].isna().any():
-            continue
-        _pool_data = _pool_data.interpolate(limit_direction="both")
-
-        # pool info
-        pools.append(pool_info[idx])
-
-        # hodl
-        _prices = _pool_data.iloc[:, 0]
-        _hodl = _prices.pct_change()
-        hodl.append(_hodl)
-
-        # apy
-        _tvls = _pool_data.iloc[:, 1]
-        _rewards = _pool_data.iloc[:, 2]
-        _apy = _rewards.diff() / _tvls.shift()
-        apy.append(_apy)
-
-    hodl = pd.DataFrame(hodl).T.iloc[1:]
-    apy = pd.DataFrame(apy).T.iloc[1:]
+from covariance import cholesky_factor, estimate_covariance
+from database.pool_data import DAY, dense_levels, load_pool_data, snapshot_watermark
+from database.store import pool_data_store
+from messari.cache import CACHE_DIR, atomic_write, prune
+
+logger = logging.getLogger(__name__)
+
+RETURNS_CACHE_DIR = os.path.join(CACHE_DIR, "returns")
+RETURNS_CACHE_SIZE = 8
+RETURNS_CACHE_VERSION = 2  # bumped when the cached columns change
+PROCESSES = int(os.environ.get("FRONTIER_PROCESSES", os.cpu_count() or 1))
+
+# daily returns by cache key
+_returns = {}
+
+# covariances attached from shared memory in a worker, by block name
+_shared_covs = {}
+
+
+def _returns_key(days, end, watermark):
+    key = json.dumps(
+        {"days": days, "end": end, "version": RETURNS_CACHE_VERSION, **watermark},
+        sort_keys=True,
+    )
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+
+def _load_returns(key):
+    path = os.path.join(RETURNS_CACHE_DIR, key)
+    try:
+        pools = pd.read_parquet(os.path.join(path, "pools.parquet"))
+        hodl = pd.read_parquet(os.path.join(path, "hodl.parquet"))
+        apy = pd.read_parquet(os.path.join(path, "apy.parquet"))
+    except (OSError, ValueError):
+        return None
+
+    # columns are stored by pool id, as pool names need not be unique
+    names = pd.Index(pools["name"])
+    hodl.columns = apy.columns = names
+    pools = pd.Series(pools.to_dict("records"), index=names)
+    return pools, hodl, apy
+
+
+def _save_returns(key, pools, hodl, apy):
+    path = os.path.join(RETURNS_CACHE_DIR, key)
+    pools = pd.DataFrame(list(pools), columns=["id", "name", "protocol", "start"])
+    try:
+        with atomic_write(path, directory=True) as tmp:
+            pools.to_parquet(os.path.join(tmp, "pools.parquet"))
+            hodl.set_axis(pools["id"], axis=1).to_parquet(
+                os.path.join(tmp, "hodl.parquet")
+            )
+            apy.set_axis(pools["id"], axis=1).to_parquet(
+                os.path.join(tmp, "apy.parquet")
+            )
+    except OSError as e:
+        logger.warning(f"Failed to cache daily returns: {e}")
+        return
+
+    # keep only the latest results
+    prune(RETURNS_CACHE_DIR, RETURNS_CACHE_SIZE)
+
+
+def daily_returns(days=120, end=None):
+    """Return the pools with their daily hodl returns and apys.
+
+    Returns are computed from the daily pool levels kept by the exporters in
+    the pool data store. Pools hold the `start` timestamp of their first day
+    with data, as the levels before it are filled in flat. Results are cached in memory and as Parquet files in
+    the cache volume, keyed by the snapshot watermark, and recomputed only
+    once new snapshots are exported.
+    """
+    watermark = snapshot_watermark()
+    if end is None:
+        end = watermark["timestamp"]
+    end = end - end % DAY + DAY
+    key = _returns_key(days, end, watermark)
+    if key not in _returns:
+        _returns[key] = _load_returns(key)
+    if _returns[key] is None:
+        _returns[key] = _daily_returns(end - days * DAY, end, watermark)
+        _save_returns(key, *_returns[key])
+    pools, hodl, apy = _returns[key]
+    return pools.copy(), hodl.copy(), apy.copy()
+
+
+def _daily_returns(start, end, watermark):
+    # daily levels from the pool data store, or the database if it is behind
+    stored = pool_data_store.window(start, end, watermark)
+    if stored is None:
+        pool_info, pool_data = load_pool_data(start, end)
+        days, levels = dense_levels(pool_data, start, end)
+    else:
+        pool_info, days, levels = stored
+        logger.debug(f"Read {len(days)} days of {len(pool_info)} pools from store")
+
+    # pools by id, trimmed to the days with data of pools with snapshots
+    order = np.argsort([pool["id"] for pool in pool_info], kind="stable")
+    pool_info, levels = [pool_info[idx] for idx in order], levels[:, :, order]
+    active = ~np.isnan(levels[1:]).all(axis=(0, 1))
+    rows = np.flatnonzero(~np.isnan(levels[:, :, active]).all(axis=(0, 2)))
+    if len(rows) > 0:
+        days, levels = days[rows[0] : rows[-1] + 1], levels[:, rows[0] : rows[-1] + 1]
+
+    # skip pools with missing data on the last day
+    keep = active & ~np.isnan(levels[:, -1]).any(axis=0) if len(days) > 0 else active
+    index = pd.Index(pd.to_datetime(days, unit="s"), name="timestamp")
+    prices, tvls, rewards = [
+        pd.DataFrame(level[:, keep], index=index).interpolate(limit_direction="both")
+        for level in levels
+    ]
+
+    hodl = prices.pct_change().iloc[1:]
+    apy = (rewards.diff() / tvls.shift()).iloc[1:]
     apy.replace([np.inf, -np.inf], 0.0, inplace=True)
     apy.fillna(0.0, inplace=True)
-    pools = pd.Series(pools, index=hodl.columns)
+    pools = [pool for pool, kept in zip(pool_info, keep) if kept]
+    # first day with data of each pool, before which the levels are filled in
+    first = np.argmax(~np.isnan(levels[:, :, keep]).all(axis=0), axis=0)
+    pools = [{**pool, "start": int(days[idx])} for pool, idx in zip(pools, first)]
+    hodl.columns = apy.columns = [pool["name"] for pool in pools]
+    pools = pd.Series(pools, index=hodl.columns, dtype=object)
     return pools, hodl, apy
 
 
 def pool_stats(pools, returns):
     T = 30  # monthly stats
     mu = (1 + returns).prod() ** (T / len(returns)) - 1
-    cov = returns.cov() * T
-    sigma = np.sqrt(np.diag(cov))
+    sigma = returns.std().to_numpy() * np.sqrt(T)
 
     # remove outliers
     mu_iqr = np.quantile(mu, 0.75) - np.quantile(mu, 0.25)
@@ -139,40 +155,202 @@ def pool_stats(pools, returns):
 
     pools = pools[~mask]
     mu = mu[~mask]
-    cov = returns.loc[:, ~mask].cov() * T
+    cov = estimate_covariance(returns.loc[:, ~mask]) * T
     return pools, mu, cov
 
 
-def efficient_frontier(mu, cov, num_samples=100, threshold=0.1):
-    # maximize return given the target std
-    def efficient_return(target_std):
-        N = len(mu)
+def _volatility(weights, factor):
+    # portfolio volatility and its gradient, from the cholesky factor
+    factor_weights = factor @ weights
+    std = np.sqrt(factor_weights @ factor_weights)
+    return std, factor.T @ factor_weights / std
+
+
+# fully invested portfolios, with the jacobian of the constraint
+BUDGET_CONSTRAINT = {
+    "type": "eq",
+    "fun": lambda x: np.sum(x) - 1,
+    "jac": lambda x: np.ones_like(x),
+}
+
+
+def corner_portfolios(mu, cov, ridge=1e-8):
+    """Trace the long-only efficient frontier with the critical line algorithm.
+
+    Returns the corner portfolios as rows, from the maximum return portfolio
+    down to the minimum variance portfolio. Efficient portfolios between two
+    adjacent corners are their convex combinations. A small ridge relative to
+    the average variance keeps the free-set systems solvable when there are
+    more pools than observations. Equal returns are told apart by a tiny
+    perturbation in pool order, as the algorithm never frees or bounds a pool
+    whose return ties with the free ones.
+    """
+    returns = np.asarray(mu, dtype=float)
+    cov = np.asarray(cov, dtype=float)
+    N = len(returns)
+    scale = np.abs(returns).max(initial=0.0) or 1.0
+    mu = returns + np.arange(N) * 1e-9 * scale / N
+    cov = cov + np.eye(N) * ridge * np.trace(cov) / N
+    variances = np.diag(cov)
+
+    # start from the maximum return asset, at the upper bound of one
+    weights = np.zeros(N)
+    is_free = np.zeros(N, dtype=bool)
+    free = [int(np.argmax(mu))]
+    is_free[free] = True
+    weights[free] = 1.0
+    corners, last_lambda, last_idx = [weights.copy()], np.inf, None
+
+    # inverse covariance of the free weights and its product with all columns,
+    # updated by blocks as single weights enter or leave the free set
+    cov_free_inv = np.linalg.inv(cov[np.ix_(free, free)])
+    inv_cov = cov_free_inv @ cov[free]
+    while True:
+        bounded = np.flatnonzero(~is_free)
+        c4 = cov_free_inv.sum(axis=1)  # inverse times ones
+        c2 = cov_free_inv @ mu[free]
+        c1, c3 = c4.sum(), c2.sum()
+        cov_bounded = cov[:, bounded] @ weights[bounded]
+        l3 = inv_cov[:, bounded] @ weights[bounded]
+        l1 = weights[bounded].sum()
+
+        # a free weight reaching one of its bounds
+        lambda_in, idx_in = -np.inf, None
+        if len(free) > 1:
+            c = -c1 * c2 + c3 * c4
+            bound = np.where(c > 0, 1.0, 0.0)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                lambdas = ((1 - l1 + l3.sum()) * c4 - c1 * (bound + l3)) / c
+            # skip the weight just freed, which sits at this lambda already
+            lambdas[(c == 0) | (np.asarray(free) == last_idx)] = -np.inf
+            idx_in = int(np.argmax(lambdas))
+            lambda_in = lambdas[idx_in]
+
+        # a bounded weight becoming free, with the block inverse of each
+        # enlarged free set
+        lambda_out, idx_out = -np.inf, None
+        if len(bounded) > 0:
+            u = inv_cov[:, bounded]
+            schur = variances[bounded] - np.einsum(
+                "ij,ij->j", cov[np.ix_(free, bounded)], u
+            )
+            w = weights[bounded]
+            shift = 1 - u.sum(axis=0)
+            new_c4 = shift / schur
+            new_c2 = (mu[bounded] - u.T @ mu[free]) / schur
+            new_c1 = c1 + shift**2 / schur
+            new_c3 = c3 + shift * new_c2
+            new_l3 = (cov_bounded[bounded] - u.T @ cov_bounded[free]) / schur - w
+            new_l3_sum = c4 @ cov_bounded[free] - w * u.sum(axis=0) + shift * new_l3
+            c = -new_c1 * new_c2 + new_c3 * new_c4
+            with np.errstate(divide="ignore", invalid="ignore"):
+                lambdas = (
+                    (1 - (l1 - w) + new_l3_sum) * new_c4 - new_c1 * (w + new_l3)
+                ) / c
+            # lambda decreases along the frontier
+            skip = (c == 0) | ~(lambdas < last_lambda) | (bounded == last_idx)
+            lambdas[skip] = -np.inf
+            idx_out = int(np.argmax(lambdas))
+            lambda_out = lambdas[idx_out]
+
+        if lambda_in < 0 and lambda_out < 0:
+            # minimum variance portfolio of the free weights
+            lam = 0.0
+        elif lambda_in > lambda_out:
+            lam, last_idx = lambda_in, free.pop(idx_in)
+            is_free[last_idx] = False
+            weights[last_idx] = bound[idx_in]
+            column = cov_free_inv[:, idx_in] / cov_free_inv[idx_in, idx_in]
+            inv_cov -= np.outer(column, inv_cov[idx_in])
+            cov_free_inv -= np.outer(column, cov_free_inv[idx_in])
+            cov_free_inv = np.delete(np.delete(cov_free_inv, idx_in, 0), idx_in, 1)
+            inv_cov = np.delete(inv_cov, idx_in, 0)
+        else:
+            lam, last_idx = lambda_out, bounded[idx_out]
+            is_free[last_idx] = True
+            column = u[:, idx_out]
+            row = (cov[last_idx] - column @ cov[free]) / schur[idx_out]
+            free.append(last_idx)
+            inv_cov = np.vstack([inv_cov - np.outer(column, row), row])
+            cov_free_inv = np.block(
+                [
+                    [
+                        cov_free_inv + np.outer(column, column) / schur[idx_out],
+                        -column[:, np.newaxis] / schur[idx_out],
+                    ],
+                    [-column[np.newaxis, :] / schur[idx_out], 1 / schur[idx_out]],
+                ]
+            )
 
-        def neg_portfolio_return(weights):
-            return -(mu * weights).sum()
+        bounded = np.flatnonzero(~is_free)
+        c4 = cov_free_inv.sum(axis=1)
+        c2 = cov_free_inv @ mu[free]
+        l3 = inv_cov[:, bounded] @ weights[bounded]
+        gamma = (-lam * c2.sum() + 1 - weights[bounded].sum() + l3.sum()) / c4.sum()
+        weights[free] = -l3 + gamma * c4 + lam * c2
+        corners.append(weights.copy())
+        last_lambda = lam
+        if lam == 0.0:
+            break
 
-        def portfolio_std(weights):
-            return np.sqrt(
-                (weights[np.newaxis, :] @ cov @ weights[:, np.newaxis]).sum()
-            )
+    # drop corners that do not lower the return, from numerical noise
+    corners = np.clip(corners, 0.0, 1.0)
+    corners /= corners.sum(axis=1, keepdims=True)
+    corner_returns = corners @ returns
+    keep = [0]
+    for idx in range(1, len(corners)):
+        if corner_returns[idx] <= corner_returns[keep[-1]] + 1e-12:
+            keep.append(idx)
+    return corners[keep]
+
+
+def frontier_portfolio(corners, corner_cov, target_std):
+    """Return the efficient portfolio with the target volatility, if any.
+
+    `corner_cov` holds the covariances between the corner portfolios. The
+    portfolio is the convex combination of the two adjacent corners that has
+    the target volatility.
+    """
+    stds = np.sqrt(np.maximum(np.diag(corner_cov), 0.0))
+    if target_std > stds[0] * (1 + 1e-9):
+        return None
+    if target_std >= stds[0]:
+        return corners[0]
+    if target_std <= stds[-1]:
+        return corners[-1]
+
+    # corners are ordered by decreasing volatility
+    high = max(np.searchsorted(-stds, -target_std) - 1, 0)
+    low = high + 1
+    a, b, d = corner_cov[high, high], corner_cov[high, low], corner_cov[low, low]
+    curvature = a - 2 * b + d
+    if curvature <= 0:
+        return corners[high]
+    disc = max((b - d) ** 2 - curvature * (d - target_std**2), 0.0)
+    share = np.clip((d - b + np.sqrt(disc)) / curvature, 0.0, 1.0)
+    return share * corners[high] + (1 - share) * corners[low]
 
-        constraints = (
-            {"type": "eq", "fun": lambda x: portfolio_std(x) - target_std},
-            {"type": "eq", "fun": lambda x: np.sum(x) - 1},
-        )
-        bounds = tuple((0, 1) for _ in range(N))
-        result = minimize(
-            neg_portfolio_return, N * [1 / N], bounds=bounds, constraints=constraints
-        )
-        return -result.fun, result.x
+
+def efficient_frontier(mu, cov, num_samples=100, threshold=0.1):
+    # trace the frontier through its corner portfolios
+    corners = corner_portfolios(mu, cov)
+    corner_cov = corners @ np.asarray(cov, dtype=float) @ corners.T
 
     sigma = np.sqrt(np.diag(cov))
-    sigma_min = min_volatility_portfolio(mu, cov)[1][0]
+    sigma_min = np.sqrt(max(corner_cov[-1, -1], 0.0))
     xs = np.linspace(sigma_min, sigma.max(), num_samples)
+    points = []
+    for x in xs:
+        # maximize return given the target std
+        weights = frontier_portfolio(corners, corner_cov, x)
+        if weights is None:  # beyond the maximum return portfolio
+            break
+        points.append(((mu * weights).sum(), weights))
+
+    # keep the increasing returns, stopping at the first decrease
     ys, nonzero = [], set({})
     last_y = 0.0
-    for idx in range(num_samples):
-        new_y, weights = efficient_return(xs[idx])
+    for new_y, weights in points:
         nonzero.update(set(*np.nonzero(weights > threshold)))
         if new_y >= last_y:
             last_y = new_y
@@ -183,22 +361,26 @@ def efficient_frontier(mu, cov, num_samples=100, threshold=0.1):
     return xs[: len(ys)], ys, nonzero
 
 
-def tangency_portfolio(mu, cov):
+def tangency_portfolio(mu, cov, x0=None):
+    mu_, factor = np.asarray(mu, dtype=float), cholesky_factor(cov)
+
     # maximize sharpe ratio
     def neg_sharpe_ratio(weights):
         # assuming risk-free rate of 3%
         rf = 0.03
-        portfolio_return = (mu * weights).sum()
-        portfolio_std = np.sqrt(
-            (weights[np.newaxis, :] @ cov @ weights[:, np.newaxis]).sum()
-        )
-        return -(portfolio_return - rf) / portfolio_std
+        portfolio_return = mu_ @ weights
+        portfolio_std, std_grad = _volatility(weights, factor)
+        sharpe_ratio = (portfolio_return - rf) / portfolio_std
+        return -sharpe_ratio, -(mu_ - sharpe_ratio * std_grad) / portfolio_std
 
     N = len(mu)
-    constraints = ({"type": "eq", "fun": lambda x: np.sum(x) - 1},)
     bounds = tuple((0, 1) for _ in range(N))
     result = minimize(
-        neg_sharpe_ratio, N * [1 / N], bounds=bounds, constraints=constraints
+        neg_sharpe_ratio,
+        N * [1 / N] if x0 is None else x0,
+        jac=True,
+        bounds=bounds,
+        constraints=(BUDGET_CONSTRAINT,),
     )
     weights = result.x
     portfolio_return = (mu * weights).sum()
@@ -208,15 +390,22 @@ def tangency_portfolio(mu, cov):
     return portfolio_return, portfolio_std, weights
 
 
-def min_volatility_portfolio(mu, cov):
+def min_volatility_portfolio(mu, cov, x0=None):
+    factor = cholesky_factor(cov)
+
     # minimize volatility
     def volatility(weights):
-        return np.sqrt((weights[np.newaxis, :] @ cov @ weights[:, np.newaxis]).sum())
+        return _volatility(weights, factor)
 
     N = len(mu)
-    constraints = ({"type": "eq", "fun": lambda x: np.sum(x) - 1},)
     bounds = tuple((0, 1) for _ in range(N))
-    result = minimize(volatility, N * [1 / N], bounds=bounds, constraints=constraints)
+    result = minimize(
+        volatility,
+        N * [1 / N] if x0 is None else x0,
+        jac=True,
+        bounds=bounds,
+        constraints=(BUDGET_CONSTRAINT,),
+    )
     weights = result.x
     portfolio_return = (mu * weights).sum()
     portfolio_std = np.sqrt(
@@ -234,3 +423,51 @@ def risk_parity_portfolio(mu, cov):
         (weights[np.newaxis, :] @ cov @ weights[:, np.newaxis]).sum()
     )
     return portfolio_return, portfolio_std, weights
+
+
+def _share(cov):
+    # copy the covariance into a shared memory block once for all workers
+    values = np.asarray(cov, dtype=float)
+    shm = SharedMemory(create=True, size=max(values.nbytes, 1))
+    np.ndarray(values.shape, dtype=values.dtype, buffer=shm.buf)[:] = values
+    return shm, (shm.name, values.shape, values.dtype.str, list(cov.index))
+
+
+def _solve(solver, mu, shared):
+    # attach the shared covariance without copying, once per worker
+    name, shape, dtype, index = shared
+    if name not in _shared_covs:
+        shm = SharedMemory(name=name)
+        values = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        cov = pd.DataFrame(values, index=index, columns=index, copy=False)
+        _shared_covs[name] = shm, cov
+    return solver(mu, _shared_covs[name][1])
+
+
+def solve_portfolios(problems, processes=PROCESSES):
+    """Solve portfolio problems in parallel over a process pool.
+
+    `problems` maps keys to `(solver, mu, cov)`, where the solver is one of
+    the portfolio functions above, and the results are returned by key.
+    Covariances are shared with the workers through shared memory, once per
+    distinct covariance. Runs in this process if `processes` is at most one.
+    """
+    if processes <= 1:
+        return {key: solver(mu, cov) for key, (solver, mu, cov) in problems.items()}
+
+    blocks, shared = [], {}
+    try:
+        for _, _, cov in problems.values():
+            if id(cov) not in shared:
+                shm, shared[id(cov)] = _share(cov)
+                blocks.append(shm)
+        with ProcessPoolExecutor(max_workers=min(processes, len(problems))) as pool:
+            futures = {
+                key: pool.submit(_solve, solver, mu, shared[id(cov)])
+                for key, (solver, mu, cov) in problems.items()
+            }
+            return {key: future.result() for key, future in futures.items()}
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
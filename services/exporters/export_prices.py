@@ -1,3 +1,5 @@
+import argparse
+import asyncio
 import logging
 import logging.config
 import os
@@ -5,17 +7,36 @@ import signal
 import sys
 from datetime import datetime, timedelta
 
+import numpy as np
 import pandas as pd
 from brownie import chain
 from rich.progress import track
-from sqlmodel import Session, select
+from sqlmodel import Session, func, select
 
 sys.path.insert(1, os.path.join(sys.path[0], "..", ".."))
 
-from utils import datetime_to_block, get_prices
+from pricing import PriceFetcher
+from utils import (
+    block_cache,
+    block_index,
+    block_timestamp,
+    datetime_to_block,
+    price_cache,
+)
 
+from database.bulk import upsert
 from database.engine import engine
-from database.models import Pool, PoolSnapshot, Token, TokenSnapshot
+from database.models import (
+    ExportWatermark,
+    Pool,
+    PoolSnapshot,
+    PoolTokenWeight,
+    TokenSnapshot,
+)
+from database.pool_data import DAY
+from database.store import pool_data_store
+from messari.cache import summary
+from messari.fetch import fetch_snapshots
 from messari.subgraphs import subgraphs
 
 logging.config.dictConfig(
@@ -31,13 +52,217 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+HISTORY_DAYS = 120  # days kept up to date for the reports
+RECENT_DAYS = 2  # days exported for pools and tokens seen for the first time
+BACKFILL_DAYS = 30  # maximum number of older days backfilled per loop
+
 
 def handle_signal(*args) -> None:
     logger.error("Interrupted by user")
     sys.exit()
 
 
-def main():
+def day_timestamp(day) -> int:
+    return int(day.timestamp())
+
+
+def pending_days(days, watermark, backfill):
+    """Return the days to export and the other days to fetch along with them.
+
+    In the default mode these are the days after the watermark, or the most
+    recent days if nothing was exported yet. In backfill mode these are the
+    days before the watermark, or before the most recent days, bounded by
+    BACKFILL_DAYS. The other days are the exported days to anchor on, or for
+    ids without a watermark the ends of the history, so that changes of new
+    pools are seen over the whole history rather than a single snapshot.
+    """
+    if not backfill:
+        if watermark is None:
+            return days[-RECENT_DAYS:], days[:1]
+        todo = [day for day in days if day_timestamp(day) > watermark.end]
+        anchor = [day for day in days if day_timestamp(day) == watermark.end]
+        return todo, anchor
+
+    if watermark is None:
+        return days[:-RECENT_DAYS][-BACKFILL_DAYS:], days[-1:]
+    todo = [day for day in days if day_timestamp(day) < watermark.start]
+    anchor = [day for day in days if day_timestamp(day) == watermark.start]
+    return todo[-BACKFILL_DAYS:], anchor
+
+
+def update_watermarks(session, kind, ids, start, end):
+    # widen the exported range of each id
+    upsert(
+        session,
+        ExportWatermark,
+        {
+            "kind": [kind] * len(ids),
+            "id": ids,
+            "start": [day_timestamp(start)] * len(ids),
+            "end": [day_timestamp(end)] * len(ids),
+        },
+        update=lambda table, excluded: {
+            "start": func.least(table.c.start, excluded.start),
+            "end": func.greatest(table.c.end, excluded.end),
+        },
+    )
+
+
+def export_pools(days, block_of, backfill):
+    logger.info("Fetching pools from database")
+    with Session(engine) as session:
+        pools = session.exec(select(Pool)).all()
+        watermarks = {
+            watermark.id: watermark
+            for watermark in session.exec(
+                select(ExportWatermark).where(ExportWatermark.kind == "pool")
+            ).all()
+        }
+    logger.info(f"Fetched {len(pools)} pools from database")
+
+    # group pools that need the same range of days
+    groups = {}
+    for pool in pools:
+        todo, anchor = pending_days(days, watermarks.get(pool.id), backfill)
+        if len(todo) == 0:
+            continue
+        key = (tuple(todo), tuple(sorted(set(anchor + todo))))
+        groups.setdefault(key, []).append(pool)
+
+    exported_days = set({})
+    for (todo, fetch_days), group in groups.items():
+        logger.info(f"Fetching {len(todo)} days of snapshots for {len(group)} pools")
+        blocks = [block_of(day) for day in fetch_days]
+        todo_blocks = set(block_of(day) for day in todo)
+
+        # fetch snapshots of all pools concurrently
+        subgraph_pools = [
+            ([s for s in subgraphs if s.protocol == pool.protocol][0], pool.id)
+            for pool in group
+        ]
+        batch = asyncio.run(fetch_snapshots(subgraph_pools, blocks))
+
+        with Session(engine) as session:
+            # pool may disappear due to the token exporter
+            statement = select(Pool.id).where(Pool.id.in_([pool.id for pool in group]))
+            existing = set(session.exec(statement).all())
+
+            rows_by_pool = batch.groups()
+            exported = []
+            for pool in group:
+                rows = rows_by_pool.get(pool.id)
+                # skip new pools if no change in values over the fetched days
+                if rows is None or (
+                    pool.id not in watermarks
+                    and batch.cumulativeReward[rows.start]
+                    == batch.cumulativeReward[rows.stop - 1]
+                ):
+                    continue
+                if pool.id not in existing:
+                    continue
+                exported.append(pool.id)
+
+            # snapshots and token weights of the exported pools on the days to do
+            batch = batch.take(
+                np.isin(batch.pool_id, exported)
+                & np.isin(batch.blockNumber, list(todo_blocks))
+            )
+            upsert(session, PoolSnapshot, batch.rows())
+            upsert(session, PoolTokenWeight, batch.weight_rows())
+            update_watermarks(session, "pool", exported, todo[0], todo[-1])
+            session.commit()
+        if len(exported) > 0:
+            exported_days.update(todo)
+    return exported_days
+
+
+def export_prices(days, block_of, backfill):
+    # fetch tokens from top 50 pools with high tvl
+    logger.info("Fetching tokens for pools with high TVL")
+    addresses = set({})
+    with Session(engine) as session:
+        statement = (
+            select(PoolSnapshot)
+            .where(PoolSnapshot.blockNumber == block_of(days[-1]))
+            .order_by(PoolSnapshot.totalValueLocked.desc())
+            .limit(50)
+        )
+        for snapshot in session.exec(statement).all():
+            addresses.update([token.id for token in snapshot.pool.tokens])
+        watermarks = {
+            watermark.id: watermark
+            for watermark in session.exec(
+                select(ExportWatermark).where(ExportWatermark.kind == "token")
+            ).all()
+        }
+    logger.info(f"Fetched {len(addresses)} tokens")
+
+    # collect the tokens to price at each day
+    todo_by_token, tokens_by_day = {}, {}
+    for address in addresses:
+        todo, _ = pending_days(days, watermarks.get(address), backfill)
+        # ordered moving away from the watermark
+        todo_by_token[address] = todo[::-1] if backfill else todo
+        for day in todo:
+            tokens_by_day.setdefault(day, []).append(address)
+    if len(tokens_by_day) == 0:
+        return set({})
+
+    # fetch prices in parallel, writing them as they complete
+    logger.info(f"Fetching prices of tokens for {len(tokens_by_day)} days")
+    days_by_block = {block_of(day): day for day in tokens_by_day}
+    fetcher = PriceFetcher(price_cache)
+    tasks = list(
+        fetcher.chunks(
+            (block_of(day), addresses) for day, addresses in tokens_by_day.items()
+        )
+    )
+    exported = set({})
+    for block, addresses, prices in track(
+        fetcher.fetch(tasks), description="prices", total=len(tasks)
+    ):
+        if prices is None:
+            continue
+        timestamp = block_timestamp(block)
+        with Session(engine) as session:
+            upsert(
+                session,
+                TokenSnapshot,
+                {
+                    "id": [address + "_" + str(block) for address in addresses],
+                    "blockNumber": [block] * len(addresses),
+                    "timestamp": [timestamp] * len(addresses),
+                    "price": prices,
+                    "token_id": addresses,
+                },
+                update=["price"],
+            )
+            session.commit()
+        # missing prices are retried once the negative cache expires
+        exported.update(
+            (address, days_by_block[block])
+            for address, price in zip(addresses, prices)
+            if price is not None
+        )
+
+    # advance watermarks up to the first day that failed or has no price
+    ranges = {}
+    for address, todo in todo_by_token.items():
+        done = []
+        for day in todo:
+            if (address, day) not in exported:
+                break
+            done.append(day)
+        if len(done) > 0:
+            ranges.setdefault((min(done), max(done)), []).append(address)
+    with Session(engine) as session:
+        for (start, end), addresses in ranges.items():
+            update_watermarks(session, "token", addresses, start, end)
+        session.commit()
+    return set(day for _, day in exported)
+
+
+def main(backfill=False):
     # handle signals
     signal.signal(signal.SIGINT, handle_signal)
     signal.signal(signal.SIGTERM, handle_signal)
@@ -48,74 +273,40 @@ def main():
         # create snapshots for blocks closest to midnight in UTC
         dt = datetime.fromtimestamp(block.timestamp)
         dt = datetime.combine(dt.date(), datetime.min.time()) - timedelta(days=121)
-        blocks = [datetime_to_block(dt) for dt in pd.date_range(dt, periods=120)]
+        days = list(pd.date_range(dt, periods=HISTORY_DAYS))
 
-        # update pool data
-        logger.info("Fetching pools from database")
-        with Session(engine) as session:
-            pools = session.exec(select(Pool)).all()
-            logger.info(f"Fetched {len(pools)} pools from database")
-            for pool in pools:
-                subgraph = [s for s in subgraphs if s.protocol == pool.protocol][0]
-                snapshots = subgraph.snapshots(pool.id, blocks)
-                # skip if no change in values
-                if (
-                    len(snapshots) == 0
-                    or snapshots[0].cumulativeReward == snapshots[-1].cumulativeReward
-                ):
-                    continue
+        # only resolve the blocks of the days that are exported
+        blocks = {}
 
-                for snapshot in snapshots:
-                    # pool may disappear due to the token exporter
-                    if (
-                        session.get(PoolSnapshot, snapshot.id) is not None
-                        or session.get(Pool, pool.id) is None
-                    ):
-                        continue
-                    session.add(PoolSnapshot(**snapshot.__dict__, pool=pool))
-                session.commit()
-
-        # fetch tokens from top 50 pools with high tvl
-        logger.info("Fetching tokens for pools with high TVL")
-        addresses = set({})
-        with Session(engine) as session:
-            statement = (
-                select(PoolSnapshot)
-                .where(PoolSnapshot.blockNumber == blocks[-1])
-                .order_by(PoolSnapshot.totalValueLocked.desc())
-                .limit(50)
+        def block_of(day):
+            if day not in blocks:
+                blocks[day] = datetime_to_block(day)
+            return blocks[day]
+
+        exported = export_pools(days, block_of, backfill)
+        exported |= export_prices(days, block_of, backfill)
+        block_index.flush()
+        block_cache.flush()
+
+        # re-read the exported days into the pool data store, with a day of
+        # margin as the blocks closest to midnight may fall on either side
+        if len(exported) > 0:
+            pool_data_store.update(
+                day_timestamp(min(exported)) - DAY,
+                day_timestamp(max(exported)) + 2 * DAY,
             )
-            for snapshot in session.exec(statement).all():
-                addresses.update([token.id for token in snapshot.pool.tokens])
-        addresses = list(addresses)
-        logger.info(f"Fetched {len(addresses)} tokens")
-
-        # fetch prices
-        logger.info("Fetching prices of tokens")
-        for block in track(blocks, description="prices"):
-            try:
-                prices = get_prices(addresses, block)
-            except Exception as e:
-                logger.error(e)
-                continue
-            with Session(engine) as session:
-                for address, price in zip(addresses, prices):
-                    price_id = address + "_" + str(block)
-                    snapshot = session.get(TokenSnapshot, price_id)
-                    if snapshot is not None:
-                        snapshot.price = price
-                    else:
-                        session.add(
-                            TokenSnapshot(
-                                id=price_id,
-                                blockNumber=block,
-                                timestamp=chain[block].timestamp,
-                                price=price,
-                                token=session.get(Token, address),
-                            )
-                        )
-                session.commit()
+
+        logger.info(f"Subgraph client stats: {summary()}")
+        logger.info(f"Price cache stats: {dict(price_cache.stats)}")
+        logger.info(f"Block cache stats: {dict(block_cache.stats)}")
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--backfill",
+        action="store_true",
+        help=f"export up to {BACKFILL_DAYS} older days per loop",
+    )
+    args = parser.parse_args()
+    main(backfill=args.backfill)
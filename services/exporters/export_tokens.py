@@ -1,19 +1,31 @@
+import asyncio
 import logging
 import logging.config
 import os
 import signal
 import sys
+from functools import partial
 
 from brownie import chain
-from rich.progress import track
-from sqlmodel import Session
+from sqlmodel import Session, delete, update
 
 sys.path.insert(1, os.path.join(sys.path[0], "..", ".."))
 
-from utils import get_prices
+from pricing import PriceFetcher
+from utils import price_cache
 
+from database.bulk import upsert
 from database.engine import engine
-from database.models import Pool, Token
+from database.models import (
+    ExportWatermark,
+    Pool,
+    PoolSnapshot,
+    PoolTokenLink,
+    PoolTokenWeight,
+    Token,
+)
+from messari.cache import summary
+from messari.fetch import iter_pools
 from messari.subgraphs import subgraphs
 
 logging.config.dictConfig(
@@ -29,12 +41,132 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+BATCH_SIZE = 500  # tokens priced per call
+
 
 def handle_signal(*args) -> None:
     logger.error("Interrupted by user")
     sys.exit()
 
 
+def delete_pools(session, pool_ids):
+    # same effect as deleting the pools through the orm: snapshots are kept
+    # but detached from the pool and token links and weights are removed
+    session.exec(
+        update(PoolSnapshot)
+        .where(PoolSnapshot.pool_id.in_(pool_ids))
+        .values(pool_id=None)
+        .execution_options(synchronize_session=False)
+    )
+    session.exec(
+        delete(PoolTokenLink)
+        .where(PoolTokenLink.pool_id.in_(pool_ids))
+        .execution_options(synchronize_session=False)
+    )
+    session.exec(
+        delete(PoolTokenWeight)
+        .where(PoolTokenWeight.pool_id.in_(pool_ids))
+        .execution_options(synchronize_session=False)
+    )
+    session.exec(
+        delete(ExportWatermark)
+        .where(ExportWatermark.kind == "pool", ExportWatermark.id.in_(pool_ids))
+        .execution_options(synchronize_session=False)
+    )
+    session.exec(
+        delete(Pool)
+        .where(Pool.id.in_(pool_ids))
+        .execution_options(synchronize_session=False)
+    )
+
+
+def add_pools(session, pools, protocol):
+    # insert new pools and tokens, leaving existing ones untouched
+    tokens = {token.id: token for pool in pools for token in pool.tokens}
+    links = {(pool.id, token.id) for pool in pools for token in pool.tokens}
+    upsert(
+        session,
+        Pool,
+        {
+            "id": [pool.id for pool in pools],
+            "name": [pool.name for pool in pools],
+            "protocol": [protocol] * len(pools),
+        },
+        update=[],
+    )
+    upsert(
+        session,
+        Token,
+        {
+            "id": [token.id for token in tokens.values()],
+            "name": [token.name for token in tokens.values()],
+            "symbol": [token.symbol for token in tokens.values()],
+        },
+        update=[],
+    )
+    upsert(
+        session,
+        PoolTokenLink,
+        {
+            "pool_id": [pool_id for pool_id, _ in links],
+            "token_id": [token_id for _, token_id in links],
+        },
+        update=[],
+    )
+
+
+def export_page(pools, protocol, prices, failed, fetcher, block):
+    # price the tokens not seen on earlier pages, once per block
+    addresses = list(
+        {
+            token.id
+            for pool in pools
+            for token in pool.tokens
+            if token.id not in prices and token.id not in failed
+        }
+    )
+    tasks = list(fetcher.chunks([(block, addresses)]))
+    for _, _addresses, _prices in fetcher.fetch(tasks):
+        if _prices is None:
+            failed.update(_addresses)
+        else:
+            prices.update(zip(_addresses, _prices))
+
+    added, removed = [], []
+    for pool in pools:
+        # skip if prices could not be fetched
+        addresses = [token.id for token in pool.tokens]
+        if any(address not in prices for address in addresses):
+            continue
+
+        # remove pool if price does not exist
+        if any(prices[address] is None for address in addresses):
+            removed.append(pool.id)
+        else:
+            added.append(pool)
+
+    with Session(engine) as session:
+        delete_pools(session, removed)
+        add_pools(session, added, protocol)
+        session.commit()
+
+
+async def export_pools(block):
+    # price and write each page of pools while the next pages are fetched
+    prices, failed = {}, set({})
+    # prices at the latest block are never stored, so skip looking them up
+    fetcher = PriceFetcher(partial(price_cache, stored=False), chunk_size=BATCH_SIZE)
+    counts = {subgraph.protocol: 0 for subgraph in subgraphs}
+    async for subgraph, pools in iter_pools(subgraphs):
+        await asyncio.to_thread(
+            export_page, pools, subgraph.protocol, prices, failed, fetcher, block
+        )
+        counts[subgraph.protocol] += len(pools)
+    for protocol, count in counts.items():
+        logger.info(f"Fetched {count} pools from {protocol}")
+    logger.info(f"Fetched prices of {len(prices)} distinct tokens")
+
+
 def main():
     # handle signals
     signal.signal(signal.SIGINT, handle_signal)
@@ -43,51 +175,12 @@ def main():
     for block in chain.new_blocks(height_buffer=1000):
         logger.info(f"Starting loop for block {block.number}")
 
-        # update the list of tokens
-        for subgraph in subgraphs:
-            logger.info(f"Fetching pools from {subgraph.protocol}")
-            pools = subgraph.pools
-            logger.info(f"Fetched {len(pools)} pools from {subgraph.protocol}")
-
-            for pool in track(pools, description=subgraph.protocol):
-                # check if price exists
-                tokens = [Token(**token.__dict__) for token in pool.tokens]
-                addresses = [token.id for token in pool.tokens]
-                try:
-                    prices = get_prices(addresses, block.number)
-                except Exception as e:
-                    logger.debug(e)
-                    continue
-
-                # remove pool if price does not exist
-                if any(price is None for price in prices):
-                    with Session(engine) as session:
-                        _pool = session.get(Pool, pool.id)
-                        if _pool is not None:
-                            session.delete(_pool)
-                        session.commit()
-                    continue
-
-                # add new pool
-                with Session(engine) as session:
-                    if session.get(Pool, pool.id) is not None:
-                        continue
-                    tokens = []
-                    for token in pool.tokens:
-                        _token = session.get(Token, token.id)
-                        if _token is None:
-                            tokens.append(Token(**token.__dict__))
-                        else:
-                            tokens.append(_token)
-                    session.add(
-                        Pool(
-                            id=pool.id,
-                            name=pool.name,
-                            protocol=subgraph.protocol,
-                            tokens=tokens,
-                        )
-                    )
-                    session.commit()
+        # stream pools from all subgraphs concurrently
+        logger.info(f"Fetching pools from {len(subgraphs)} subgraphs")
+        asyncio.run(export_pools(block.number))
+
+        logger.info(f"Subgraph client stats: {summary()}")
+        logger.info(f"Price cache stats: {dict(price_cache.stats)}")
 
 
 if __name__ == "__main__":
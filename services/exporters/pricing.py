@@ -0,0 +1,90 @@
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+logger = logging.getLogger(__name__)
+
+MAX_CONCURRENCY = int(os.environ.get("PRICE_CONCURRENCY", 8))
+CHUNK_SIZE = int(os.environ.get("PRICE_CHUNK_SIZE", 50))
+RETRIES = int(os.environ.get("PRICE_RETRIES", 3))
+BACKOFF = float(os.environ.get("PRICE_BACKOFF", 1.0))
+
+
+def _get_prices(get_prices, addresses, block, retries, backoff):
+    # retry with exponential backoff, re-raising the last error
+    for attempt in range(retries + 1):
+        try:
+            return get_prices(addresses, block)
+        except Exception as e:
+            if attempt == retries:
+                raise
+            delay = backoff * 2**attempt
+            logger.debug(f"Retrying prices at block {block} in {delay}s: {e}")
+            time.sleep(delay)
+
+
+class PriceFetcher:
+    """Fans price lookups out over a thread pool.
+
+    Lookups are split by block and into chunks of `chunk_size` addresses, with
+    at most `max_concurrency` chunks in flight against the provider. Failed
+    chunks are retried with exponential backoff.
+    """
+
+    def __init__(
+        self,
+        get_prices,
+        max_concurrency=MAX_CONCURRENCY,
+        chunk_size=CHUNK_SIZE,
+        retries=RETRIES,
+        backoff=BACKOFF,
+    ):
+        self.get_prices = get_prices
+        self.max_concurrency = max_concurrency
+        self.chunk_size = chunk_size
+        self.retries = retries
+        self.backoff = backoff
+
+    def chunks(self, tasks):
+        for block, addresses in tasks:
+            for idx in range(0, len(addresses), self.chunk_size):
+                yield block, list(addresses[idx : idx + self.chunk_size])
+
+    def fetch(self, tasks):
+        """Price `(block, addresses)` tasks, yielding results as they complete.
+
+        Yields `(block, addresses, prices)` for every chunk, where `prices`
+        is None if the chunk still failed after all retries.
+        """
+        chunks = self.chunks(tasks)
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            pending = {}
+
+            def submit():
+                # keep at most max_concurrency chunks in flight
+                for block, addresses in chunks:
+                    future = executor.submit(
+                        _get_prices,
+                        self.get_prices,
+                        addresses,
+                        block,
+                        self.retries,
+                        self.backoff,
+                    )
+                    pending[future] = (block, addresses)
+                    if len(pending) >= self.max_concurrency:
+                        break
+
+            submit()
+            while len(pending) > 0:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    block, addresses = pending.pop(future)
+                    try:
+                        prices = future.result()
+                    except Exception as e:
+                        logger.error(f"Failed to fetch prices at block {block}: {e}")
+                        prices = None
+                    yield block, addresses, prices
+                submit()
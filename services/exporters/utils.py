@@ -1,8 +1,13 @@
+import fcntl
 import os
-from datetime import datetime
+import threading
+import time
+from collections import Counter, OrderedDict
 
 import brownie
+import numpy as np
 from brownie.network.state import Chain
+from sqlmodel import Session, select
 
 os.environ["BROWNIE_NETWORK_ID"] = "mainnet"
 brownie._config.CONFIG.settings["autofetch_sources"] = True
@@ -10,29 +15,323 @@ brownie._config.CONFIG.networks["mainnet"]["host"] = os.environ["WEB3_PROVIDER"]
 
 from ypricemagic.magic import magic
 
+from database.bulk import upsert
+from database.engine import engine
+from database.models import Block, TokenSnapshot
+from messari.cache import atomic_write
+
 chain = Chain()
 
+CACHE_DIR = os.environ.get(
+    "CACHE_DIR", os.path.join(os.path.dirname(__file__), "..", "..", "cache")
+)
+PRICE_CACHE_SIZE = int(os.environ.get("PRICE_CACHE_SIZE", 100_000))
+PRICE_NEGATIVE_TTL = float(os.environ.get("PRICE_NEGATIVE_TTL", 6 * 60 * 60))
+BLOCK_INDEX_FLUSH_ROWS = int(os.environ.get("BLOCK_INDEX_FLUSH_ROWS", 256))
+BLOCK_INDEX_FLUSH_INTERVAL = float(
+    os.environ.get("BLOCK_INDEX_FLUSH_INTERVAL", 60 * 60)
+)
+
+
+class BlockIndex:
+    """Sorted (block number, timestamp) pairs persisted as a memory-mapped array.
+
+    Every block probed by a date search is added, so that date lookups for
+    already visited dates are answered locally without any RPC call. New
+    blocks are written once `flush_rows` of them are pending or after
+    `flush_interval` seconds, as writing rewrites the whole index.
+    """
+
+    def __init__(
+        self,
+        path,
+        flush_rows=BLOCK_INDEX_FLUSH_ROWS,
+        flush_interval=BLOCK_INDEX_FLUSH_INTERVAL,
+    ):
+        self.path = path
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.data = self._load()
+        self.pending = {}
+        self.unsaved = 0
+        self.flushed_at = time.monotonic()
+
+    def __len__(self):
+        self._merge()
+        return len(self.data)
+
+    def add(self, number, timestamp):
+        self.pending[int(number)] = int(timestamp)
+
+    def _merge(self):
+        if len(self.pending) == 0:
+            return
+        pending = np.array(list(self.pending.items()), dtype=np.int64)
+        data = np.concatenate([np.asarray(self.data), pending])
+        # sort by block number and drop duplicated blocks
+        _, idx = np.unique(data[:, 0], return_index=True)
+        self.unsaved += len(idx) - len(self.data)
+        self.data = data[idx]
+        self.pending = {}
+
+    def _load(self):
+        try:
+            return np.load(self.path, mmap_mode="r")
+        except (OSError, ValueError):
+            return np.empty((0, 2), dtype=np.int64)
+
+    def flush(self, force=False):
+        self._merge()
+        if self.unsaved == 0:
+            return
+        if (
+            not force
+            and self.unsaved < self.flush_rows
+            and time.monotonic() - self.flushed_at < self.flush_interval
+        ):
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # other services write the same index, so merge their blocks under a lock
+        with open(self.path + ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                data = np.concatenate([np.asarray(self.data), self._load()])
+                _, idx = np.unique(data[:, 0], return_index=True)
+                with atomic_write(self.path) as tmp, open(tmp, "wb") as f:
+                    np.save(f, data[idx])
+                self.data = self._load()
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        self.unsaved = 0
+        self.flushed_at = time.monotonic()
+
+    def timestamp(self, number):
+        self._merge()
+        idx = np.searchsorted(self.data[:, 0], number)
+        if idx < len(self.data) and self.data[idx, 0] == number:
+            return int(self.data[idx, 1])
+        return None
+
+    def search(self, timestamp, tol):
+        """Find the indexed block closest to a timestamp.
+
+        Returns the block number if it is within `tol` seconds, otherwise the
+        closest indexed blocks below and above the timestamp to narrow an RPC
+        search (either may be None).
+        """
+        self._merge()
+        idx = int(np.searchsorted(self.data[:, 1], timestamp))
+        below = self.data[idx - 1] if idx > 0 else None
+        above = self.data[idx] if idx < len(self.data) else None
+        candidates = [row for row in (below, above) if row is not None]
+        if len(candidates) > 0:
+            number, block_timestamp = min(
+                candidates, key=lambda row: abs(int(row[1]) - timestamp)
+            )
+            if abs(timestamp - int(block_timestamp)) < tol:
+                return int(number), None, None
+        return (
+            None,
+            None if below is None else int(below[0]),
+            None if above is None else int(above[0]),
+        )
+
+
+block_index = BlockIndex(os.path.join(CACHE_DIR, "block_index.npy"))
+
+
+class BlockCache:
+    """Bounded LRU of block timestamps backed by the block index and database.
+
+    Timestamps missing locally are fetched through RPC and written to the
+    database on `flush`.
+    """
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.pending = {}
+        self.stats = Counter()
+
+    def __getitem__(self, number):
+        number = int(number)
+        if number in self.data:
+            self.data.move_to_end(number)
+            self.stats["hits"] += 1
+            return self.data[number]
+
+        timestamp = block_index.timestamp(number)
+        if timestamp is not None:
+            self.stats["index_hits"] += 1
+        else:
+            with Session(engine) as session:
+                block = session.get(Block, number)
+            if block is not None:
+                self.stats["database_hits"] += 1
+                timestamp = block.timestamp
+            else:
+                self.stats["misses"] += 1
+                timestamp = chain[number].timestamp
+                self.pending[number] = timestamp
+            block_index.add(number, timestamp)
+
+        self.data[number] = timestamp
+        if len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+        return timestamp
+
+    def flush(self):
+        if len(self.pending) == 0:
+            return
+        with Session(engine) as session:
+            upsert(
+                session,
+                Block,
+                {
+                    "number": list(self.pending.keys()),
+                    "timestamp": list(self.pending.values()),
+                },
+                update=[],
+            )
+            session.commit()
+        self.pending = {}
+
+
+block_cache = BlockCache()
+
+
+def block_timestamp(number):
+    return block_cache[number]
+
 
 def binary_search(low, high, dt, tol=600):
-    if high >= low:
-        mid = (high + low) // 2
-        block = chain[mid]
-        block_dt = datetime.fromtimestamp(block.timestamp)
-        diff = int((dt - block_dt).total_seconds())
+    # interpolation search seeded by the block timestamps at both ends,
+    # alternating with bisection steps to bound the worst case
+    target = dt.timestamp()
+    low_timestamp, high_timestamp = block_timestamp(low), block_timestamp(high)
+    interpolate = True
+    while high >= low:
+        if interpolate and high_timestamp > low_timestamp:
+            mid = low + int(
+                (target - low_timestamp)
+                * (high - low)
+                / (high_timestamp - low_timestamp)
+            )
+            mid = min(max(mid, low), high)
+        else:
+            mid = (high + low) // 2
+        interpolate = not interpolate
+
+        timestamp = block_timestamp(mid)
+        diff = int(target - timestamp)
         if abs(diff) < tol:
             return mid
         elif diff > 0:
-            return binary_search(mid, high, dt, tol=tol)
+            low, low_timestamp = mid + 1, timestamp
         else:
-            return binary_search(low, mid, dt, tol=tol)
-    else:
-        return -1
+            high, high_timestamp = mid - 1, timestamp
+    return -1
+
 
+def datetime_to_block(dt, tol=600):
+    # answer from the local index if a block within tolerance is known
+    number, low, high = block_index.search(dt.timestamp(), tol)
+    if number is not None:
+        return number
 
-def datetime_to_block(dt):
-    latest = chain[-1]["number"]
-    return binary_search(0, latest, dt)
+    latest = chain[-1]
+    block_index.add(latest.number, latest.timestamp)
+    return binary_search(
+        0 if low is None else low,
+        latest.number if high is None else high,
+        dt,
+        tol=tol,
+    )
 
 
 def get_prices(addresses, block):
     return magic.get_prices(addresses, block, fail_to_None=True, silent=False)
+
+
+class PriceCache:
+    """Caches prices by (token, block) in front of a pricing function.
+
+    Prices at a past block never change, so known prices are answered from an
+    in-process LRU, then from the `TokenSnapshot` table, and only the misses
+    are priced. Missing (None) prices are cached for `negative_ttl` seconds
+    only, as a price source may become available later. Callers pricing blocks
+    without stored prices, such as the latest block, skip the table with
+    `stored=False`.
+    """
+
+    def __init__(
+        self, get_prices, maxsize=PRICE_CACHE_SIZE, negative_ttl=PRICE_NEGATIVE_TTL
+    ):
+        self.get_prices = get_prices
+        self.maxsize = maxsize
+        self.negative_ttl = negative_ttl
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = Counter()
+
+    def _count(self, key, count):
+        with self.lock:
+            self.stats[key] += count
+
+    def _get(self, key):
+        # returns (found, price), dropping expired negative entries
+        with self.lock:
+            if key not in self.data:
+                return False, None
+            price, expires = self.data[key]
+            if expires is not None and expires < time.time():
+                del self.data[key]
+                return False, None
+            self.data.move_to_end(key)
+            return True, price
+
+    def _set(self, key, price):
+        expires = None if price is not None else time.time() + self.negative_ttl
+        with self.lock:
+            self.data[key] = (price, expires)
+            self.data.move_to_end(key)
+            if len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def _load(self, addresses, block):
+        # known prices stored by the price exporter
+        ids = [address + "_" + str(block) for address in addresses]
+        statement = select(TokenSnapshot.token_id, TokenSnapshot.price).where(
+            TokenSnapshot.id.in_(ids), TokenSnapshot.price != None
+        )
+        with Session(engine) as session:
+            return dict(session.exec(statement).all())
+
+    def __call__(self, addresses, block, stored=True):
+        prices, missing = {}, []
+        for address in addresses:
+            found, price = self._get((address, block))
+            if found:
+                prices[address] = price
+            else:
+                missing.append(address)
+        self._count("hits", len(addresses) - len(missing))
+
+        if stored and len(missing) > 0:
+            loaded = self._load(missing, block)
+            self._count("database_hits", len(loaded))
+            for address, price in loaded.items():
+                prices[address] = price
+                self._set((address, block), price)
+            missing = [address for address in missing if address not in loaded]
+
+        if len(missing) > 0:
+            self._count("misses", len(missing))
+            for address, price in zip(missing, self.get_prices(missing, block)):
+                prices[address] = price
+                self._set((address, block), price)
+
+        return [prices[address] for address in addresses]
+
+
+price_cache = PriceCache(get_prices)